@@ -1,21 +1,25 @@
-from datetime import datetime
-
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.responses import JSONResponse
+from fastapi.security import HTTPAuthorizationCredentials
 from pymongo.errors import DuplicateKeyError
+from typing import Optional
 import httpx
 import logging
 
+from app.core.dates import utcnow
 from app.core.security import (
     authenticate_user,
     clear_auth_cookie,
     create_access_token,
     get_current_user,
     hash_password,
+    request_token,
     sanitize_user,
+    security,
     set_auth_cookie,
 )
 from app.db.mongo import get_db
+from app.services.principals import principal_cache
 from app.services.users import get_user_by_email
 from models import TokenResponse, UserCreate, UserLogin, UserPublic
 from config import settings
@@ -33,8 +37,8 @@ async def signup(payload: UserCreate, db=Depends(get_db)):
 
     user_doc = {
         "email": payload.email,
-        "hashed_password": hash_password(payload.password),
-        "created_at": datetime.utcnow().isoformat(),
+        "hashed_password": await hash_password(payload.password),
+        "created_at": utcnow(),
     }
 
     try:
@@ -79,7 +83,10 @@ async def get_me(current_user: UserPublic = Depends(get_current_user)):
 
 
 @router.post("/logout")
-async def logout():
+async def logout(request: Request, token: Optional[HTTPAuthorizationCredentials] = Depends(security)):
+    raw_token = request_token(request, token)
+    if raw_token:
+        principal_cache.invalidate_token(raw_token)
     response = JSONResponse({"detail": "Logged out"})
     clear_auth_cookie(response)
     return response
@@ -157,7 +164,7 @@ async def facebook_oauth_callback(code: str, state: str = None, db=Depends(get_d
                 # Update last login timestamp
                 await db["users"].update_one(
                     {"_id": user["_id"]},
-                    {"$set": {"last_login": datetime.utcnow().isoformat()}}
+                    {"$set": {"last_login": utcnow()}}
                 )
             else:
                 # Create new user for business account
@@ -169,8 +176,8 @@ async def facebook_oauth_callback(code: str, state: str = None, db=Depends(get_d
                     "name": fb_data.get("name", f"Business Account {facebook_id}"),
                     "email": generated_email,
                     "login_type": "facebook_business",
-                    "created_at": datetime.utcnow().isoformat(),
-                    "last_login": datetime.utcnow().isoformat(),
+                    "created_at": utcnow(),
+                    "last_login": utcnow(),
                 }
                 result = await db["users"].insert_one(user_doc)
                 user_doc["_id"] = result.inserted_id
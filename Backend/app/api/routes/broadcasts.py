@@ -1,26 +1,86 @@
-import asyncio
-from datetime import datetime
+from typing import List, Optional
 from uuid import uuid4
 
-from fastapi import APIRouter, Depends, HTTPException
+from bson import ObjectId
+from fastapi import APIRouter, Depends, Header, HTTPException
+from pymongo.errors import BulkWriteError, PyMongoError
 
+from app.core.dates import to_iso, utcnow
+from app.core.responses import AppJSONResponse
 from app.core.security import get_current_user
-from app.services.templates import send_template_message
+from app.services.broadcasts import fail_unqueued
+from app.services.contacts import normalize_phone
+from app.services.dashboard_stats import dashboard_stats_cache
+from app.services.idempotency import claim_key, complete_key, release_key
+from app.services.outbox import enqueue_broadcast_messages
+from app.services.segments import load_segment_rule, segment_phones
+from app.services.templates import template_preview_text
 from app.db.mongo import get_db
 from models import BroadcastRequest, TemplateRequest, UserPublic
 
 router = APIRouter(tags=["broadcasts"])
 
-RATE_LIMIT_PER_SECOND = 1
-
-
-@router.post("/broadcasts")
-async def create_broadcast(req: BroadcastRequest, current_user: UserPublic = Depends(get_current_user), db = Depends(get_db)):
-    if not req.phones or not req.template_name:
-        raise HTTPException(status_code=400, detail="Phones and template_name are required")
+# Recipients live in the broadcast document, which must stay well under Mongo's 16MB limit
+MAX_BROADCAST_RECIPIENTS = 10000
+# Recipients queued per outbox write
+ENQUEUE_BATCH = 500
+
+
+async def _audience(db, user_id: str, req: BroadcastRequest) -> List[str]:
+    """Explicit phones followed by the segment's contacts, without repeats"""
+    # Canonical form, as stored on contacts, so the same person given both ways is messaged once
+    phones = []
+    for raw in req.phones:
+        phone = normalize_phone(raw)
+        if not phone:
+            raise HTTPException(status_code=400, detail=f"Invalid phone number: {raw}")
+        phones.append(phone)
+    phones = list(dict.fromkeys(phones))
+    if req.segment_id:
+        try:
+            user_oid, segment_oid = ObjectId(user_id), ObjectId(req.segment_id)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid segment id")
+        rule = await load_segment_rule(db, user_oid, segment_oid)
+        seen = set(phones)
+        contacts = segment_phones(db, user_oid, rule)
+        try:
+            async for phone in contacts:
+                if phone not in seen:
+                    seen.add(phone)
+                    phones.append(phone)
+                    if len(phones) > MAX_BROADCAST_RECIPIENTS:
+                        break
+        finally:
+            # Closes the cursor when stopping at the cap
+            await contacts.aclose()
+    if not phones:
+        raise HTTPException(status_code=400, detail="Segment has no contacts")
+    if len(phones) > MAX_BROADCAST_RECIPIENTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BROADCAST_RECIPIENTS} recipients per broadcast")
+    return phones
+
+
+@router.post("/broadcasts", status_code=202)
+async def create_broadcast(
+    req: BroadcastRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: UserPublic = Depends(get_current_user),
+    db = Depends(get_db),
+):
+    if (not req.phones and not req.segment_id) or not req.template_name:
+        raise HTTPException(status_code=400, detail="Phones or segment_id, and template_name are required")
+
+    # Resolved before claiming the key so an unknown segment doesn't leave the key in progress
+    phones = await _audience(db, current_user.id, req)
+
+    # A retried request replays the first broadcast's result instead of messaging everyone again
+    stored = await claim_key(db, current_user.id, "broadcasts", idempotency_key, req.model_dump())
+    if stored is not None:
+        return stored
 
     broadcast_id = str(uuid4())
-    now = datetime.utcnow()
+    now = utcnow()
     broadcast = {
         "_id": broadcast_id,
         "id": broadcast_id,
@@ -29,84 +89,88 @@ async def create_broadcast(req: BroadcastRequest, current_user: UserPublic = Dep
         "template_name": req.template_name,
         "template_id": req.template_id,
         "language_code": req.language_code,
-        "created_at": now.isoformat(),
-        "sent_at": None,
+        "created_at": now,
+        "sent_at": now,
         "completed_at": None,
-        "status": "pending",
-        "recipients": [{"phone": phone, "status": "pending", "details": None} for phone in req.phones],
-        "total": len(req.phones),
+        "status": "sending",
+        "recipients": [{"phone": phone, "status": "pending", "details": None} for phone in phones],
+        "total": len(phones),
         "sent": 0,
         "failed": 0,
-        "pending": len(req.phones),
+        "pending": len(phones),
     }
 
-    # Insert broadcast into database
-    await db.broadcasts.insert_one(broadcast)
-
-    # Update status to sending
-    await db.broadcasts.update_one(
-        {"_id": broadcast_id},
-        {"$set": {"status": "sending", "sent_at": datetime.utcnow().isoformat()}}
-    )
-
-    for idx, recipient in enumerate(broadcast["recipients"]):
-        try:
-            template_req = TemplateRequest(
-                phone=recipient["phone"],
-                template_name=req.template_name,
-                template_id=req.template_id,
-                language_code=req.language_code,
-                body_parameters=req.body_parameters,
-                header_parameters=req.header_parameters,
-                header_type=req.header_type,
-            )
-
-            res = await send_template_message(template_req, db=db, user_id=current_user.id)
-
-            if isinstance(res, dict) and res.get("success"):
-                recipient["status"] = "sent"
-                recipient["details"] = res.get("whatsapp_response")
-            else:
-                recipient["status"] = "failed"
-                recipient["details"] = res.get("details") if isinstance(res, dict) else {"error": "Unknown error"}
-        except Exception as exc:
-            print(f"Unexpected error sending to {recipient['phone']}: {str(exc)}")
-            recipient["status"] = "failed"
-            recipient["details"] = {"error": str(exc)}
-
-        # Update database after each recipient
-        sent = sum(1 for r in broadcast["recipients"] if r["status"] == "sent")
-        failed = sum(1 for r in broadcast["recipients"] if r["status"] == "failed")
-        pending = sum(1 for r in broadcast["recipients"] if r["status"] == "pending")
-        
-        await db.broadcasts.update_one(
-            {"_id": broadcast_id},
-            {"$set": {
-                "recipients": broadcast["recipients"],
-                "sent": sent,
-                "failed": failed,
-                "pending": pending
-            }}
-        )
-
-        await asyncio.sleep(1.0 / RATE_LIMIT_PER_SECOND)
-
-    # Final update with completed status
-    sent = sum(1 for r in broadcast["recipients"] if r["status"] == "sent")
-    failed = sum(1 for r in broadcast["recipients"] if r["status"] == "failed")
-    
-    await db.broadcasts.update_one(
-        {"_id": broadcast_id},
-        {"$set": {
-            "status": "completed",
-            "completed_at": datetime.utcnow().isoformat(),
-            "sent": sent,
-            "failed": failed,
-            "pending": 0
-        }}
-    )
-
-    return {"id": broadcast_id, "total": len(broadcast["recipients"]), "sent": sent, "failed": failed, "broadcast": broadcast}
+    queued = 0
+    inserted = False
+    try:
+        # Inserted before its jobs, so the dispatcher always finds it to record progress
+        await db.broadcasts.insert_one(broadcast)
+        inserted = True
+        dashboard_stats_cache.invalidate(current_user.id)
+
+        # The outbox delivers (paced by the shared send limiter) and reports through broadcast_progress
+        for first in range(0, len(phones), ENQUEUE_BATCH):
+            batch = []
+            for phone in phones[first:first + ENQUEUE_BATCH]:
+                template_req = TemplateRequest(
+                    phone=phone,
+                    template_name=req.template_name,
+                    template_id=req.template_id,
+                    language_code=req.language_code,
+                    body_parameters=req.body_parameters,
+                    header_parameters=req.header_parameters,
+                    header_type=req.header_type,
+                )
+                message_doc = {
+                    "chatId": phone,
+                    "senderId": current_user.id,
+                    "receiverId": phone,
+                    "owner": current_user.id,
+                    "direction": "outgoing",
+                    "text": template_preview_text(template_req),
+                    "status": "sending",
+                    "messageType": "template",
+                    "templateName": req.template_name,
+                    "broadcastId": broadcast_id,
+                    "createdAt": now,
+                    "updatedAt": now,
+                    "whatsappMessageId": None,
+                }
+                batch.append((message_doc, "template", template_req.model_dump()))
+            try:
+                queued += await enqueue_broadcast_messages(db, current_user.id, broadcast_id, first, batch)
+            except BulkWriteError as exc:
+                queued += exc.details.get("nInserted", 0)
+                raise
+    except Exception as exc:
+        # Settle the key either way, so retries neither get 409 for the whole TTL nor resend
+        print(f"Broadcast {broadcast_id} aborted after queueing {queued} of {len(phones)} recipients: {exc}")
+        if not queued:
+            if inserted:
+                try:
+                    await db.broadcasts.update_one(
+                        {"_id": broadcast_id},
+                        {"$set": {"status": "failed", "completed_at": utcnow(), "error": str(exc)}},
+                    )
+                except PyMongoError:
+                    pass
+            # Nothing will reach the Graph API; the client may safely retry with the same key
+            await release_key(db, current_user.id, "broadcasts", idempotency_key)
+        else:
+            # The queued recipients are still delivered; the rest are reported failed
+            try:
+                await fail_unqueued(db, broadcast_id, queued, len(phones), str(exc))
+            except PyMongoError:
+                pass
+            await complete_key(db, current_user.id, "broadcasts", idempotency_key, {
+                "id": broadcast_id, "total": len(phones), "queued": queued, "status": "sending",
+            })
+        raise
+
+    # A summary only: progress comes over the socket, recipients from GET /broadcasts/{id}
+    result = {"id": broadcast_id, "total": len(phones), "queued": queued, "status": "sending"}
+    await complete_key(db, current_user.id, "broadcasts", idempotency_key, result)
+    return result
 
 
 @router.get("/broadcasts")
@@ -127,12 +191,12 @@ async def list_broadcasts(current_user: UserPublic = Depends(get_current_user),
                 "failed": broadcast.get("failed", 0),
                 "pending": broadcast.get("pending", 0),
                 "status": broadcast.get("status", "unknown"),
-                "created_at": broadcast.get("created_at"),
-                "sent_at": broadcast.get("sent_at"),
-                "completed_at": broadcast.get("completed_at"),
+                "created_at": to_iso(broadcast.get("created_at")),
+                "sent_at": to_iso(broadcast.get("sent_at")),
+                "completed_at": to_iso(broadcast.get("completed_at")),
             }
         )
-    return summaries
+    return AppJSONResponse(summaries)
 
 
 @router.get("/broadcasts/{broadcast_id}")
@@ -140,4 +204,5 @@ async def get_broadcast(broadcast_id: str, current_user: UserPublic = Depends(ge
     broadcast = await db.broadcasts.find_one({"_id": broadcast_id, "user_id": current_user.id})
     if not broadcast:
         raise HTTPException(status_code=404, detail="Broadcast not found")
-    return broadcast
+    # Recipient lists can be large; datetimes are encoded by orjson directly
+    return AppJSONResponse(broadcast)
@@ -1,15 +1,24 @@
-from typing import List
+from typing import List, Optional
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 
+from app.core.dates import to_iso, utcnow
 from app.core.security import get_current_user
+from app.core.responses import AppJSONResponse
 from app.db.mongo import get_db
-from models import ContactListCreate, ContactListUpdate, UserPublic
+from app.db.pagination import encode_cursor, keyset_filter
+from app.services.contacts import contact_filter_query
+from app.services.dashboard_stats import dashboard_stats_cache
+from app.services.list_counts import increment_list_count
+from models import ContactListCreate, ContactListUpdate, ListMembershipRequest, UserPublic
 
 
 router = APIRouter(prefix="/contacts/lists", tags=["contact-lists"])
 
+MAX_PAGE_SIZE = 500
+MAX_BULK_CONTACT_IDS = 10000
+
 
 def _oid(id_str: str) -> ObjectId:
     try:
@@ -22,7 +31,8 @@ def _sanitize_list(doc):
     return {
         "id": str(doc["_id"]),
         "name": doc.get("name", ""),
-        "created_at": doc.get("created_at", ""),
+        "created_at": to_iso(doc.get("created_at")) or "",
+        "contact_count": doc.get("contact_count", 0),
     }
 
 
@@ -40,31 +50,21 @@ async def create_list(payload: ContactListCreate, current_user: UserPublic = Dep
     doc = {
         "user_id": user_oid,
         "name": name,
-        "created_at": __import__("datetime").datetime.utcnow().isoformat(),
+        "created_at": utcnow(),
+        "contact_count": 0,
     }
     res = await db["contact_lists"].insert_one(doc)
     doc["_id"] = res.inserted_id
+    dashboard_stats_cache.invalidate(current_user.id)
     return _sanitize_list(doc)
 
 
 @router.get("", response_model=dict)
 async def list_lists(current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
     user_oid = _oid(current_user.id)
+    # contact_count is maintained on each list by contact writes (see app/services/list_counts.py)
     lists_cursor = db["contact_lists"].find({"user_id": user_oid}).sort("created_at", -1)
-    lists = [l async for l in lists_cursor]
-    # Counts per list via aggregation on contacts
-    counts = {}
-    pipeline = [
-        {"$match": {"user_id": user_oid}},
-        {"$unwind": "$list_ids"},
-        {"$group": {"_id": "$list_ids", "count": {"$sum": 1}}},
-    ]
-    async for row in db["contacts"].aggregate(pipeline):
-        counts[str(row["_id"])] = row["count"]
-
-    return {
-        "lists": [{**_sanitize_list(l), "contact_count": counts.get(str(l["_id"]), 0)} for l in lists],
-    }
+    return {"lists": [_sanitize_list(l) async for l in lists_cursor]}
 
 
 @router.patch("/{list_id}", response_model=dict)
@@ -99,19 +99,100 @@ async def delete_list(list_id: str, current_user: UserPublic = Depends(get_curre
     if res.deleted_count == 0:
         raise HTTPException(status_code=404, detail="List not found")
     # Pull list id from contacts
-    await db["contacts"].update_many({"user_id": user_oid}, {"$pull": {"list_ids": lid}})
+    await db["contacts"].update_many({"user_id": user_oid, "list_ids": lid}, {"$pull": {"list_ids": lid}})
+    dashboard_stats_cache.invalidate(current_user.id)
     return {"success": True}
 
 
 @router.get("/{list_id}/contacts", response_model=List[dict])
-async def get_list_contacts(list_id: str, current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
+async def get_list_contacts(
+    list_id: str,
+    before: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    current_user: UserPublic = Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Newest members first; pass X-Next-Cursor back as `before` for the next page"""
     user_oid = _oid(current_user.id)
     lid = _oid(list_id)
-    cursor = db["contacts"].find({"user_id": user_oid, "list_ids": lid})
-    docs = [d async for d in cursor]
-    return [{
+    query = {"user_id": user_oid, "list_ids": lid}
+    query.update(keyset_filter("created_at", before, -1))
+    cursor = (
+        db["contacts"]
+        .find(query, {"name": 1, "phone": 1, "created_at": 1})
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit)
+    )
+    docs = await cursor.to_list(length=limit)
+
+    headers = {}
+    if len(docs) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(docs[-1]["created_at"], docs[-1]["_id"])
+    return AppJSONResponse([{
         "id": str(d["_id"]),
         "name": d.get("name", ""),
         "phone": d.get("phone", ""),
-        "created_at": d.get("created_at", ""),
-    } for d in docs]
+        "created_at": to_iso(d.get("created_at")) or "",
+    } for d in docs], headers=headers)
+
+
+def _membership_selector(user_oid: ObjectId, payload: ListMembershipRequest) -> dict:
+    if (payload.contact_ids is None) == (payload.filter is None):
+        raise HTTPException(status_code=400, detail="Provide either contact_ids or filter")
+    if payload.filter is not None:
+        return contact_filter_query(user_oid, payload.filter)
+    if len(payload.contact_ids) > MAX_BULK_CONTACT_IDS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_CONTACT_IDS} contact ids per request")
+    try:
+        ids = [ObjectId(cid) for cid in payload.contact_ids]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid contact id")
+    return {"user_id": user_oid, "_id": {"$in": ids}}
+
+
+async def _owned_list(db, user_oid: ObjectId, list_id: str) -> ObjectId:
+    lid = _oid(list_id)
+    if not await db["contact_lists"].find_one({"_id": lid, "user_id": user_oid}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="List not found")
+    return lid
+
+
+@router.post("/{list_id}/contacts/add")
+async def add_contacts_to_list(
+    list_id: str,
+    payload: ListMembershipRequest,
+    current_user: UserPublic = Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Add many contacts (by id or by filter) to a list in one update_many"""
+    user_oid = _oid(current_user.id)
+    lid = await _owned_list(db, user_oid, list_id)
+    selector = _membership_selector(user_oid, payload)
+
+    # Excluding current members makes modified_count exactly the number of new memberships
+    res = await db["contacts"].update_many(
+        {"$and": [selector, {"list_ids": {"$ne": lid}}]},
+        {"$addToSet": {"list_ids": lid}},
+    )
+    count = await increment_list_count(db, user_oid, lid, res.modified_count)
+    return {"added": res.modified_count, "contact_count": count}
+
+
+@router.post("/{list_id}/contacts/remove")
+async def remove_contacts_from_list(
+    list_id: str,
+    payload: ListMembershipRequest,
+    current_user: UserPublic = Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Remove many contacts (by id or by filter) from a list in one update_many"""
+    user_oid = _oid(current_user.id)
+    lid = await _owned_list(db, user_oid, list_id)
+    selector = _membership_selector(user_oid, payload)
+
+    res = await db["contacts"].update_many(
+        {"$and": [selector, {"list_ids": lid}]},
+        {"$pull": {"list_ids": lid}},
+    )
+    count = await increment_list_count(db, user_oid, lid, -res.modified_count)
+    return {"removed": res.modified_count, "contact_count": count}
@@ -1,15 +1,32 @@
-from typing import List, Optional
+import csv
+import io
+from typing import List, Literal, Optional
 
 from bson import ObjectId
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile
+from fastapi.responses import StreamingResponse
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
+from app.core.dates import to_iso, utcnow
+from app.core.responses import AppJSONResponse, dumps
 from app.core.security import get_current_user
 from app.db.mongo import get_db
+from app.db.pagination import encode_cursor, keyset_filter
+from app.services.contact_directory import contact_directory
+from app.services.contact_import import start_import
+from app.services.contacts import normalize_phone
+from app.services.dashboard_stats import dashboard_stats_cache
+from app.services.list_counts import adjust_list_counts
 from models import ContactCreate, ContactPublic, ContactUpdate, UserPublic
 
 
 router = APIRouter(prefix="/contacts", tags=["contacts"])
 
+MAX_PAGE_SIZE = 500
+CONTACT_PROJECTION = {"name": 1, "phone": 1, "list_ids": 1, "attributes": 1, "created_at": 1}
+EXPORT_BATCH_SIZE = 1000
+
 
 def _oid(id_str: str) -> ObjectId:
     try:
@@ -18,14 +35,27 @@ def _oid(id_str: str) -> ObjectId:
         raise HTTPException(status_code=400, detail="Invalid id")
 
 
+def _contact_dict(doc) -> dict:
+    return {
+        "id": str(doc["_id"]),
+        "name": doc.get("name", ""),
+        "phone": doc.get("phone", ""),
+        "list_ids": [str(lid) for lid in doc.get("list_ids", [])],
+        "attributes": doc.get("attributes") or {},
+        "created_at": to_iso(doc.get("created_at")) or "",
+    }
+
+
+def _attributes(attributes: dict) -> dict:
+    # Keys become field paths (attributes.<key>) in segment queries
+    for key in attributes:
+        if not key or key.startswith("$") or "." in key:
+            raise HTTPException(status_code=400, detail=f"Invalid attribute name: {key!r}")
+    return attributes
+
+
 def _sanitize_contact(doc) -> ContactPublic:
-    return ContactPublic(
-        id=str(doc["_id"]),
-        name=doc.get("name", ""),
-        phone=doc.get("phone", ""),
-        list_ids=[str(lid) for lid in doc.get("list_ids", [])],
-        created_at=doc.get("created_at", ""),
-    )
+    return ContactPublic(**_contact_dict(doc))
 
 
 @router.post("", response_model=ContactPublic)
@@ -38,71 +68,175 @@ async def create_contact(
     list_oids: List[ObjectId] = []
     if payload.list_ids:
         try:
-            list_oids = [ObjectId(lid) for lid in payload.list_ids]
+            list_oids = list(dict.fromkeys(ObjectId(lid) for lid in payload.list_ids))
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid list id")
 
-    # Basic phone normalization (keep digits and leading '+')
-    phone = payload.phone.strip()
+    phone = normalize_phone(payload.phone)
     if not phone:
-        raise HTTPException(status_code=400, detail="Phone is required")
+        raise HTTPException(status_code=400, detail="A valid phone number with country code is required")
 
     doc = {
         "user_id": user_oid,
         "name": payload.name.strip(),
         "phone": phone,
         "list_ids": list_oids,
-        "created_at": __import__("datetime").datetime.utcnow().isoformat(),
+        "attributes": _attributes(payload.attributes),
+        "created_at": utcnow(),
     }
-    res = await db["contacts"].insert_one(doc)
+    try:
+        res = await db["contacts"].insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Contact with this phone already exists")
     doc["_id"] = res.inserted_id
+    await adjust_list_counts(db, user_oid, added=list_oids)
+    contact_directory.forget(current_user.id, [phone])
+    dashboard_stats_cache.invalidate(current_user.id)
     return _sanitize_contact(doc)
 
 
+def _contacts_query(user_oid: ObjectId, list_id: Optional[str]) -> dict:
+    query = {"user_id": user_oid}
+    if list_id:
+        query["list_ids"] = _oid(list_id)
+    return query
+
+
 @router.get("", response_model=List[ContactPublic])
 async def list_contacts(
     list_id: Optional[str] = Query(None),
+    before: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
     current_user: UserPublic = Depends(get_current_user),
     db=Depends(get_db),
 ):
-    user_oid = _oid(current_user.id)
-    query = {"user_id": user_oid}
-    if list_id:
-        query["list_ids"] = _oid(list_id)
+    """Newest contacts first; pass X-Next-Cursor back as `before` for the next page"""
+    query = _contacts_query(_oid(current_user.id), list_id)
+    query.update(keyset_filter("created_at", before, -1))
+
+    cursor = (
+        db["contacts"]
+        .find(query, CONTACT_PROJECTION)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit)
+    )
+    docs = await cursor.to_list(length=limit)
+
+    headers = {}
+    if len(docs) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(docs[-1]["created_at"], docs[-1]["_id"])
+    # Built from our own documents, so response_model re-validation is skipped (it still documents the shape)
+    return AppJSONResponse([_contact_dict(d) for d in docs], headers=headers)
+
 
-    cursor = db["contacts"].find(query).sort("created_at", -1)
-    docs = [d async for d in cursor]
-    return [_sanitize_contact(d) for d in docs]
+async def _export_ndjson(cursor):
+    async for doc in cursor:
+        yield dumps(_contact_dict(doc)) + b"\n"
+
+
+async def _export_csv(cursor):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["id", "name", "phone", "list_ids", "created_at"])
+    async for doc in cursor:
+        row = _contact_dict(doc)
+        writer.writerow([row["id"], row["name"], row["phone"], ";".join(row["list_ids"]), row["created_at"]])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+@router.get("/export")
+async def export_contacts(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    list_id: Optional[str] = Query(None),
+    current_user: UserPublic = Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Every matching contact, streamed row by row from the cursor"""
+    cursor = (
+        db["contacts"]
+        .find(_contacts_query(_oid(current_user.id), list_id), CONTACT_PROJECTION)
+        .sort([("created_at", -1), ("_id", -1)])
+        .batch_size(EXPORT_BATCH_SIZE)
+    )
+    if format == "csv":
+        return StreamingResponse(
+            _export_csv(cursor),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="contacts.csv"'},
+        )
+    return StreamingResponse(
+        _export_ndjson(cursor),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="contacts.ndjson"'},
+    )
 
 
 @router.get("/stats")
 async def contacts_stats(current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
-    user_oid = _oid(current_user.id)
-    total = await db["contacts"].count_documents({"user_id": user_oid})
-    return {"total": total}
+    stats = await dashboard_stats_cache.get(db, current_user.id)
+    return {"total": stats["contacts"]}
 
 @router.get("/dashboard/stats")
 async def dashboard_stats(current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
     """
     Aggregate endpoint that returns all dashboard statistics.
     Returns counts for: contacts, contact lists, templates, and broadcasts
+    (served from the per-tenant stats cache; see app/services/dashboard_stats.py)
     """
-    user_oid = _oid(current_user.id)
-    
-    # Execute all counts in parallel
-    contacts_count = await db["contacts"].count_documents({"user_id": user_oid})
-    contact_lists_count = await db["contact_lists"].count_documents({"user_id": user_oid})
-    # Templates are global (shared across users from Meta), so we don't filter by user_id
-    templates_count = await db["templates"].count_documents({})
-    broadcasts_count = await db["broadcasts"].count_documents({"user_id": current_user.id})
-    
+    return await dashboard_stats_cache.get(db, current_user.id)
+
+def _sanitize_import_job(doc) -> dict:
     return {
-        "contacts": contacts_count,
-        "contact_lists": contact_lists_count,
-        "templates": templates_count,
-        "broadcasts": broadcasts_count,
+        "id": str(doc["_id"]),
+        "filename": doc.get("filename"),
+        "status": doc.get("status"),
+        "list_id": str(doc["list_id"]) if doc.get("list_id") else None,
+        "processed": doc.get("processed", 0),
+        "inserted": doc.get("inserted", 0),
+        "matched": doc.get("matched", 0),
+        "duplicates": doc.get("duplicates", 0),
+        "invalid": doc.get("invalid", 0),
+        "error": doc.get("error"),
+        "created_at": to_iso(doc.get("created_at")),
+        "finished_at": to_iso(doc.get("finished_at")),
     }
 
+
+@router.post("/import", status_code=202)
+async def import_contacts(
+    file: UploadFile = File(...),
+    list_id: Optional[str] = Form(None),
+    update_existing: bool = Form(False),
+    current_user: UserPublic = Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """
+    Import contacts from a CSV or XLSX file with a header row containing a phone column
+    (and optionally name). Existing contacts with the same phone are matched, not duplicated;
+    names are only overwritten with update_existing. Poll GET /contacts/import/{job_id} for progress.
+    """
+    user_oid = _oid(current_user.id)
+    list_oid = None
+    if list_id:
+        list_oid = _oid(list_id)
+        if not await db["contact_lists"].find_one({"_id": list_oid, "user_id": user_oid}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="List not found")
+
+    job = await start_import(db, user_oid, file, list_oid, update_existing)
+    return _sanitize_import_job(job)
+
+
+@router.get("/import/{job_id}")
+async def get_import_job(job_id: str, current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
+    job = await db["import_jobs"].find_one({"_id": _oid(job_id), "user_id": _oid(current_user.id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return _sanitize_import_job(job)
+
+
 @router.patch("/{contact_id}", response_model=ContactPublic)
 async def update_contact(
     contact_id: str,
@@ -117,33 +251,49 @@ async def update_contact(
     if payload.name is not None:
         updates["name"] = payload.name.strip()
     if payload.phone is not None:
-        updates["phone"] = payload.phone.strip()
+        updates["phone"] = normalize_phone(payload.phone)
+        if not updates["phone"]:
+            raise HTTPException(status_code=400, detail="A valid phone number with country code is required")
     if payload.list_ids is not None:
         try:
-            updates["list_ids"] = [ObjectId(lid) for lid in payload.list_ids]
+            updates["list_ids"] = list(dict.fromkeys(ObjectId(lid) for lid in payload.list_ids))
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid list id")
+    if payload.attributes is not None:
+        updates["attributes"] = _attributes(payload.attributes)
 
     if not updates:
         raise HTTPException(status_code=400, detail="No updates provided")
 
-    doc = await db["contacts"].find_one_and_update(
-        {"_id": cid, "user_id": user_oid},
-        {"$set": updates},
-        return_document=True,
-    )
-    if not doc:
+    # The previous membership is needed to adjust list counts
+    try:
+        before = await db["contacts"].find_one_and_update(
+            {"_id": cid, "user_id": user_oid},
+            {"$set": updates},
+            return_document=ReturnDocument.BEFORE,
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Contact with this phone already exists")
+    if not before:
         raise HTTPException(status_code=404, detail="Contact not found")
-    return _sanitize_contact(doc)
+    if "list_ids" in updates:
+        old, new = set(before.get("list_ids", [])), set(updates["list_ids"])
+        await adjust_list_counts(db, user_oid, added=new - old, removed=old - new)
+    if "name" in updates or "phone" in updates:
+        contact_directory.forget(current_user.id, [before.get("phone"), updates.get("phone")])
+    return _sanitize_contact({**before, **updates})
 
 
 @router.delete("/{contact_id}")
 async def delete_contact(contact_id: str, current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
     user_oid = _oid(current_user.id)
     cid = _oid(contact_id)
-    res = await db["contacts"].delete_one({"_id": cid, "user_id": user_oid})
-    if res.deleted_count == 0:
+    doc = await db["contacts"].find_one_and_delete({"_id": cid, "user_id": user_oid}, projection={"list_ids": 1, "phone": 1})
+    if not doc:
         raise HTTPException(status_code=404, detail="Contact not found")
+    await adjust_list_counts(db, user_oid, removed=doc.get("list_ids", []))
+    contact_directory.forget(current_user.id, [doc.get("phone")])
+    dashboard_stats_cache.invalidate(current_user.id)
     return {"success": True}
 
 
@@ -158,13 +308,18 @@ async def add_contact_to_list(contact_id: str, list_id: str, current_user: UserP
     if not lst:
         raise HTTPException(status_code=404, detail="List not found")
 
+    # Matching only non-members tells us whether the membership is new
     doc = await db["contacts"].find_one_and_update(
-        {"_id": cid, "user_id": user_oid},
+        {"_id": cid, "user_id": user_oid, "list_ids": {"$ne": lid}},
         {"$addToSet": {"list_ids": lid}},
-        return_document=True,
+        return_document=ReturnDocument.AFTER,
     )
-    if not doc:
-        raise HTTPException(status_code=404, detail="Contact not found")
+    if doc:
+        await adjust_list_counts(db, user_oid, added=[lid])
+    else:
+        doc = await db["contacts"].find_one({"_id": cid, "user_id": user_oid})
+        if not doc:
+            raise HTTPException(status_code=404, detail="Contact not found")
     return _sanitize_contact(doc)
 
 
@@ -174,10 +329,14 @@ async def remove_contact_from_list(contact_id: str, list_id: str, current_user:
     cid = _oid(contact_id)
     lid = _oid(list_id)
     doc = await db["contacts"].find_one_and_update(
-        {"_id": cid, "user_id": user_oid},
+        {"_id": cid, "user_id": user_oid, "list_ids": lid},
         {"$pull": {"list_ids": lid}},
-        return_document=True,
+        return_document=ReturnDocument.AFTER,
     )
-    if not doc:
-        raise HTTPException(status_code=404, detail="Contact not found")
+    if doc:
+        await adjust_list_counts(db, user_oid, removed=[lid])
+    else:
+        doc = await db["contacts"].find_one({"_id": cid, "user_id": user_oid})
+        if not doc:
+            raise HTTPException(status_code=404, detail="Contact not found")
     return _sanitize_contact(doc)
@@ -0,0 +1,62 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+
+from app.core.dates import to_iso
+from app.core.security import get_current_user
+from app.db.mongo import get_db
+from app.db.pagination import encode_cursor, keyset_filter
+from app.services.contact_directory import contact_directory
+from app.services.conversations import mark_read
+from models import UserPublic
+
+router = APIRouter(prefix="/conversations", tags=["conversations"])
+
+MAX_PAGE_SIZE = 200
+
+
+def _sanitize_conversation(doc, contact: Optional[dict] = None):
+    last_message = doc.get("lastMessage")
+    return {
+        "id": str(doc["_id"]),
+        "chatId": doc.get("chatId"),
+        # A saved contact's name wins over the WhatsApp profile name
+        "contactId": contact["id"] if contact else None,
+        "contactName": (contact and contact["name"]) or doc.get("contactName"),
+        "lastMessage": {**last_message, "createdAt": to_iso(last_message.get("createdAt"))} if last_message else None,
+        "lastActivityAt": to_iso(doc.get("lastActivityAt")),
+        "unreadCount": doc.get("unreadCount", 0),
+    }
+
+
+@router.get("")
+async def list_conversations(
+    response: Response,
+    before: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    current_user: UserPublic = Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Chats sorted by most recent activity; pass X-Next-Cursor back as `before` for the next page"""
+    query = {"owner": current_user.id}
+    query.update(keyset_filter("lastActivityAt", before, -1))
+
+    cursor = db["conversations"].find(query).sort([("lastActivityAt", -1), ("_id", -1)]).limit(limit)
+    docs = await cursor.to_list(length=limit)
+
+    if len(docs) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(docs[-1]["lastActivityAt"], docs[-1]["_id"])
+
+    contacts = await contact_directory.lookup(db, current_user.id, (d.get("chatId") for d in docs))
+    return [_sanitize_conversation(d, contacts.get(d.get("chatId"))) for d in docs]
+
+
+@router.post("/{chat_id}/read")
+async def mark_conversation_read(
+    chat_id: str,
+    current_user: UserPublic = Depends(get_current_user),
+    db=Depends(get_db),
+):
+    if not await mark_read(db, current_user.id, chat_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return {"success": True}
@@ -1,37 +1,79 @@
-from datetime import datetime
 from typing import Optional
 
-import httpx
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
 
+from app.core.dates import serialize_message, to_iso, utcnow
+from app.core.responses import AppJSONResponse
 from app.core.security import get_current_user
 from app.db.mongo import get_db
-from app.sockets import get_socket_for_user, sio
-from config import settings
+from app.db.pagination import decode_cursor, encode_cursor, keyset_filter
+from app.services.idempotency import claim_key, complete_key, release_key
+from app.services.message_cache import message_cache
+from app.services.outbox import enqueue_message
+from app.services.retention import load_archived
+from app.sockets import emit_to_user
 from models import MessageRequest, UserPublic
 
 router = APIRouter(tags=["messages"])
 
+MAX_PAGE_SIZE = 200
+
 
 @router.get("/messages")
 async def get_messages(
     chatId: Optional[str] = None,
-    limit: int = 50,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
     current_user: UserPublic = Depends(get_current_user),
     db=Depends(get_db),
 ):
-    query = {}
+    """
+    Page through a tenant's messages, oldest first within the page.
+    `before` walks back to older messages, `after` forward to newer ones; the
+    cursors for both directions come back in X-Before-Cursor / X-After-Cursor.
+    Walking back past the hot window continues transparently into the archive.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+
+    query = {"owner": current_user.id}
     if chatId:
         query["chatId"] = chatId
 
-    cursor = db["messages"].find(query).sort("createdAt", -1).limit(limit)
-    messages = await cursor.to_list(length=limit)
-
-    for msg in messages:
-        msg["id"] = str(msg.pop("_id"))
-
-    messages.reverse()
-    return messages
+    direction = 1 if after else -1
+    if chatId and not before and not after and limit <= message_cache.window:
+        # First page of a chat: served from the hot window, loading a full window on a miss
+        messages = message_cache.first_page(current_user.id, chatId, limit)
+        if messages is None:
+            cursor = db["messages"].find(query).sort([("createdAt", -1), ("_id", -1)]).limit(message_cache.window)
+            window = await cursor.to_list(length=message_cache.window)
+            message_cache.seed(current_user.id, chatId, window)
+            messages = window[:limit]
+    else:
+        query.update(keyset_filter("createdAt", after or before, direction))
+        cursor = (
+            db["messages"]
+            .find(query)
+            .sort([("createdAt", direction), ("_id", direction)])
+            .limit(limit)
+        )
+        messages = await cursor.to_list(length=limit)
+    if direction < 0 and len(messages) < limit:
+        if messages:
+            older_than = (messages[-1]["createdAt"], messages[-1]["_id"])
+        else:
+            older_than = decode_cursor(before) if before else None
+        messages += await load_archived(db, current_user.id, chatId, older_than, limit - len(messages))
+    if direction < 0:
+        messages.reverse()
+
+    headers = {}
+    if messages:
+        headers["X-Before-Cursor"] = encode_cursor(messages[0]["createdAt"], messages[0]["_id"])
+        headers["X-After-Cursor"] = encode_cursor(messages[-1]["createdAt"], messages[-1]["_id"])
+
+    return AppJSONResponse([serialize_message(msg) for msg in messages], headers=headers)
 
 
 @router.get("/messages/legacy")
@@ -44,29 +86,31 @@ async def get_messages_legacy(current_user: UserPublic = Depends(get_current_use
 @router.post("/send-message")
 async def send_message(
     req: MessageRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: UserPublic = Depends(get_current_user),
     db=Depends(get_db),
 ):
+    """Queue a text message; delivery status follows over the socket (message_status_batch)"""
     if not req.phone or not req.message:
         raise HTTPException(status_code=400, detail="Phone and message are required")
 
+    stored = await claim_key(db, current_user.id, "send-message", idempotency_key, req.model_dump())
+    if stored is not None:
+        return stored
+
+    now = utcnow()
     message_doc = {
         "chatId": req.phone,
         "senderId": current_user.id,
         "receiverId": req.phone,
+        "owner": current_user.id,
         "direction": "outgoing",
         "text": req.message,
-        "status": "sent",
-        "createdAt": datetime.utcnow().isoformat(),
-        "updatedAt": datetime.utcnow().isoformat(),
+        "status": "sending",
+        "createdAt": now,
+        "updatedAt": now,
         "whatsappMessageId": None,
     }
-
-    url = f"https://graph.facebook.com/{settings.WHATSAPP_API_VERSION}/{settings.WHATSAPP_PHONE_NUMBER_ID}/messages"
-    headers = {
-        "Authorization": f"Bearer {settings.WHATSAPP_ACCESS_TOKEN}",
-        "Content-Type": "application/json",
-    }
     payload = {
         "messaging_product": "whatsapp",
         "recipient_type": "individual",
@@ -75,60 +119,27 @@ async def send_message(
         "text": {"preview_url": False, "body": req.message},
     }
 
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            whatsapp_response = response.json()
-
-            if whatsapp_response.get("messages"):
-                message_doc["whatsappMessageId"] = whatsapp_response["messages"][0].get("id")
-
-            result = await db["messages"].insert_one(message_doc)
-            message_id = str(result.inserted_id)
-
-            response_message = {
-                "id": message_id,
-                "chatId": message_doc["chatId"],
-                "senderId": message_doc["senderId"],
-                "receiverId": message_doc["receiverId"],
-                "text": message_doc["text"],
-                "status": message_doc["status"],
-                "createdAt": message_doc["createdAt"],
-                "updatedAt": message_doc["updatedAt"],
-                "whatsappMessageId": message_doc["whatsappMessageId"],
-            }
-
-            sender_socket = get_socket_for_user(current_user.id)
-            if sender_socket:
-                await sio.emit("new_message", response_message, to=sender_socket)
-                print(f"📨 Emitted new_message to sender {current_user.id}")
-
-            return {"success": True, "message": response_message, "whatsapp_response": whatsapp_response}
-        except httpx.HTTPStatusError as e:
-            print(f"Error sending message: {e.response.text}")
-            message_doc["status"] = "failed"
-            result = await db["messages"].insert_one(message_doc)
-            message_id = str(result.inserted_id)
-
-            response_message = {
-                "id": message_id,
-                "chatId": message_doc["chatId"],
-                "senderId": message_doc["senderId"],
-                "receiverId": message_doc["receiverId"],
-                "text": message_doc["text"],
-                "status": message_doc["status"],
-                "createdAt": message_doc["createdAt"],
-                "updatedAt": message_doc["updatedAt"],
-                "whatsappMessageId": message_doc["whatsappMessageId"],
-            }
-
-            return {
-                "success": False,
-                "message": response_message,
-                "error": "Failed to send message",
-                "details": e.response.json(),
-            }
-        except Exception as e:
-            print(f"Unexpected error: {str(e)}")
-            return {"success": False, "error": "Unexpected error", "details": {"message": str(e)}}
+    try:
+        await enqueue_message(db, current_user.id, message_doc, "text", payload)
+    except Exception:
+        await release_key(db, current_user.id, "send-message", idempotency_key)
+        raise
+
+    response_message = {
+        "id": str(message_doc["_id"]),
+        "chatId": message_doc["chatId"],
+        "senderId": message_doc["senderId"],
+        "receiverId": message_doc["receiverId"],
+        "text": message_doc["text"],
+        "status": message_doc["status"],
+        "createdAt": to_iso(message_doc["createdAt"]),
+        "updatedAt": to_iso(message_doc["updatedAt"]),
+        "whatsappMessageId": message_doc["whatsappMessageId"],
+    }
+    result = {"success": True, "queued": True, "message": response_message}
+    await complete_key(db, current_user.id, "send-message", idempotency_key, result)
+
+    await emit_to_user("new_message", response_message, current_user.id)
+    print(f"📨 Queued message {response_message['id']} for {req.phone}")
+
+    return result
@@ -3,6 +3,7 @@ from pydantic import BaseModel
 import httpx
 from app.db.mongo import get_db
 from app.core.security import get_current_user
+from app.services.tenants import tenant_directory
 from models import UserPublic, WhatsAppCredential
 from config import settings
 from datetime import datetime
@@ -93,6 +94,7 @@ async def whatsapp_signup(
                 {"$set": credential.model_dump()},
                 upsert=True
             )
+            tenant_directory.set(user_id, phone_number_id)
             logger.info("Credentials saved to database", extra={"flow_id": flow_id, "user_id": user_id})
         except Exception as e:
             logger.error(f"Database save error: {e}", extra={"flow_id": flow_id}, exc_info=True)
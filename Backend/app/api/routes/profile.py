@@ -3,6 +3,7 @@ from pydantic import BaseModel
 from typing import Optional
 from app.db.mongo import get_db
 from app.core.security import get_current_user
+from app.services.tenants import tenant_directory
 from models import UserPublic
 
 router = APIRouter(prefix="/profile", tags=["profile"])
@@ -55,5 +56,7 @@ async def disconnect_whatsapp(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No WhatsApp connection found"
         )
+
+    tenant_directory.remove_user(current_user.id)
     
     return {"message": "WhatsApp disconnected successfully"}
@@ -0,0 +1,112 @@
+import re
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+
+from app.core.dates import serialize_message, to_iso
+from app.core.security import get_current_user
+from app.db.mongo import get_db
+from app.db.pagination import encode_cursor, keyset_filter
+from models import UserPublic
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+MAX_PAGE_SIZE = 100
+PHONE_QUERY = re.compile(r"[+\d\s-]+")
+
+
+def _text_query(q: str) -> str:
+    # Quote each term so they are ANDed rather than ORed by $text
+    terms = [t.replace('"', "") for t in q.split()]
+    return " ".join(f'"{t}"' for t in terms if t)
+
+
+def _clean(q: str) -> str:
+    q = q.strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Search query is required")
+    return q
+
+
+def message_search_pipeline(owner: str, text_query: str, chat_id: Optional[str], before: Optional[str], limit: int) -> list:
+    """
+    Best matches first by text score. Sorting the matches by createdAt instead made common terms
+    sort every match in memory; $sort + $limit on the score is a bounded top-k.
+    """
+    match = {"owner": owner, "$text": {"$search": text_query}}
+    if chat_id:
+        match["chatId"] = chat_id
+    pipeline = [{"$match": match}, {"$addFields": {"score": {"$meta": "textScore"}}}]
+    if before:
+        pipeline.append({"$match": keyset_filter("score", before, -1)})
+    pipeline += [{"$sort": {"score": -1, "_id": -1}}, {"$limit": limit}]
+    return pipeline
+
+
+@router.get("/messages")
+async def search_messages(
+    response: Response,
+    q: str,
+    chatId: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    current_user: UserPublic = Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """
+    Full-text search over the caller's hot messages, most relevant first; page with X-Next-Cursor.
+    Messages older than the retention window live in messages_archive and are not searched.
+    """
+    pipeline = message_search_pipeline(current_user.id, _text_query(_clean(q)), chatId, before, limit)
+    docs = await db["messages"].aggregate(pipeline).to_list(length=limit)
+
+    if len(docs) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(docs[-1]["score"], docs[-1]["_id"])
+    for doc in docs:
+        doc.pop("score", None)
+    return [serialize_message(d) for d in docs]
+
+
+@router.get("/contacts")
+async def search_contacts(
+    response: Response,
+    q: str,
+    before: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    current_user: UserPublic = Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Contacts by phone prefix (digits) or by name words; page with X-Next-Cursor"""
+    q = _clean(q)
+    try:
+        user_oid = ObjectId(current_user.id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid id")
+
+    digits = re.sub(r"\D", "", q)
+    if digits and PHONE_QUERY.fullmatch(q):
+        # Anchored prefixes stay on the (user_id, phone) index
+        query = {
+            "user_id": user_oid,
+            "$or": [
+                {"phone": {"$regex": f"^{digits}"}},
+                {"phone": {"$regex": f"^\\+{digits}"}},
+            ],
+        }
+    else:
+        query = {"user_id": user_oid, "$text": {"$search": _text_query(q)}}
+    query = {"$and": [query, keyset_filter("created_at", before, -1)]} if before else query
+
+    cursor = db["contacts"].find(query).sort([("created_at", -1), ("_id", -1)]).limit(limit)
+    docs = await cursor.to_list(length=limit)
+
+    if len(docs) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(docs[-1]["created_at"], docs[-1]["_id"])
+    return [{
+        "id": str(d["_id"]),
+        "name": d.get("name", ""),
+        "phone": d.get("phone", ""),
+        "list_ids": [str(lid) for lid in d.get("list_ids", [])],
+        "created_at": to_iso(d.get("created_at")) or "",
+    } for d in docs]
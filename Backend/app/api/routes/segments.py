@@ -0,0 +1,115 @@
+from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.core.dates import to_iso, utcnow
+from app.core.security import get_current_user
+from app.db.mongo import get_db
+from app.services.segments import count_segment, load_segment_rule, validate_segment
+from models import SegmentCreate, SegmentRule, SegmentUpdate, UserPublic
+
+
+router = APIRouter(prefix="/segments", tags=["segments"])
+
+
+def _oid(id_str: str) -> ObjectId:
+    try:
+        return ObjectId(id_str)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid id")
+
+
+def _sanitize_segment(doc):
+    return {
+        "id": str(doc["_id"]),
+        "name": doc.get("name", ""),
+        "rule": doc.get("rule"),
+        "created_at": to_iso(doc.get("created_at")) or "",
+        "updated_at": to_iso(doc.get("updated_at")) or "",
+    }
+
+
+@router.post("")
+async def create_segment(payload: SegmentCreate, current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
+    user_oid = _oid(current_user.id)
+    name = payload.name.strip()
+    if not name:
+        raise HTTPException(status_code=400, detail="Name is required")
+    await validate_segment(db, user_oid, payload.rule)
+
+    existing = await db["segments"].find_one({"user_id": user_oid, "name": name}, {"_id": 1})
+    if existing:
+        raise HTTPException(status_code=409, detail="Segment with this name already exists")
+
+    now = utcnow()
+    doc = {
+        "user_id": user_oid,
+        "name": name,
+        "rule": payload.rule.model_dump(exclude_none=True),
+        "created_at": now,
+        "updated_at": now,
+    }
+    res = await db["segments"].insert_one(doc)
+    doc["_id"] = res.inserted_id
+    return _sanitize_segment(doc)
+
+
+@router.get("")
+async def list_segments(current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
+    cursor = db["segments"].find({"user_id": _oid(current_user.id)}).sort("created_at", -1)
+    return {"segments": [_sanitize_segment(d) async for d in cursor]}
+
+
+@router.post("/preview")
+async def preview_segment(rule: SegmentRule, current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
+    """Audience size for an unsaved rule, e.g. while it is being edited"""
+    return await count_segment(db, _oid(current_user.id), rule)
+
+
+@router.get("/{segment_id}")
+async def get_segment(segment_id: str, current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
+    doc = await db["segments"].find_one({"_id": _oid(segment_id), "user_id": _oid(current_user.id)})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    return _sanitize_segment(doc)
+
+
+@router.get("/{segment_id}/count")
+async def segment_count(segment_id: str, current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
+    user_oid = _oid(current_user.id)
+    rule = await load_segment_rule(db, user_oid, _oid(segment_id))
+    return await count_segment(db, user_oid, rule)
+
+
+@router.patch("/{segment_id}")
+async def update_segment(segment_id: str, payload: SegmentUpdate, current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
+    user_oid = _oid(current_user.id)
+    updates = {}
+    if payload.name is not None:
+        name = payload.name.strip()
+        if not name:
+            raise HTTPException(status_code=400, detail="Name cannot be empty")
+        updates["name"] = name
+    if payload.rule is not None:
+        await validate_segment(db, user_oid, payload.rule)
+        updates["rule"] = payload.rule.model_dump(exclude_none=True)
+
+    if not updates:
+        raise HTTPException(status_code=400, detail="No updates provided")
+    updates["updated_at"] = utcnow()
+
+    doc = await db["segments"].find_one_and_update(
+        {"_id": _oid(segment_id), "user_id": user_oid},
+        {"$set": updates},
+        return_document=True,
+    )
+    if not doc:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    return _sanitize_segment(doc)
+
+
+@router.delete("/{segment_id}")
+async def delete_segment(segment_id: str, current_user: UserPublic = Depends(get_current_user), db=Depends(get_db)):
+    res = await db["segments"].delete_one({"_id": _oid(segment_id), "user_id": _oid(current_user.id)})
+    if res.deleted_count == 0:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    return {"success": True}
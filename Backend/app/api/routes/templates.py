@@ -1,15 +1,32 @@
+import asyncio
+import hashlib
+from typing import List, Optional, Tuple
+
 import httpx
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from pymongo import UpdateMany, UpdateOne
 from datetime import datetime, timezone, timedelta
 
+from app.core.dates import serialize_message, utcnow
+from app.core.responses import AppJSONResponse, dumps
 from app.core.security import get_current_user
 from app.db.mongo import get_db
-from app.services.templates import send_template_message
+from app.services.dashboard_stats import dashboard_stats_cache
+from app.services.idempotency import claim_key, complete_key, release_key
+from app.services.outbox import enqueue_message
+from app.services.templates import send_template_message, template_preview_text
+from app.sockets import emit_to_user
 from config import settings
-from models import TemplateCreate, TemplateRequest, UserPublic
+from models import BulkTemplateRequest, TemplateCreate, TemplateRequest, UserPublic
 
 router = APIRouter(tags=["templates"])
 
+# Meta caps page size server-side; larger pages mean fewer round trips
+TEMPLATE_SYNC_PAGE_SIZE = 100
+# Pages whose bulk_write may still be running while the next page is fetched
+TEMPLATE_SYNC_WRITE_FANOUT = 3
+
 # IST timezone (UTC+5:30)
 IST = timezone(timedelta(hours=5, minutes=30))
 
@@ -20,80 +37,125 @@ def utc_to_ist(utc_dt: datetime) -> datetime:
     return utc_dt.astimezone(IST)
 
 
+def _template_struct(item: dict) -> dict:
+    template_struct = {
+        "name": item.get("name"),
+        "language": item.get("language"),
+        "category": item.get("category"),
+        "meta_id": item.get("id"),
+        "status": item.get("status"),
+        "components": [],
+    }
+
+    for component in item.get("components", []):
+        comp_type = component.get("type")
+
+        if comp_type == "BODY":
+            text = component.get("text", "")
+            param_count = text.count("{{")
+            template_struct["components"].append(
+                {"type": "BODY", "text": text, "parameter_count": param_count}
+            )
+
+        elif comp_type == "HEADER":
+            fmt = component.get("format")
+            text = component.get("text", "")
+            param_count = text.count("{{") if fmt == "TEXT" else 0
+            template_struct["components"].append(
+                {"type": "HEADER", "format": fmt, "text": text, "parameter_count": param_count}
+            )
+
+        elif comp_type == "BUTTONS":
+            buttons = component.get("buttons", [])
+            template_struct["components"].append({"type": "BUTTONS", "buttons": buttons})
+
+    return template_struct
+
+
+async def _write_template_page(db, items: List[dict], synced_at: datetime) -> Tuple[int, int]:
+    """Upsert one page of Meta templates in a single bulk_write; returns (written, unchanged)"""
+    structs = {}
+    for item in items:
+        if item.get("id"):
+            structs[item["id"]] = _template_struct(item)
+    if not structs:
+        return 0, 0
+
+    stored = {}
+    async for doc in db["templates"].find({"meta_id": {"$in": list(structs)}}, {"meta_id": 1, "content_hash": 1}):
+        stored[doc["meta_id"]] = doc.get("content_hash")
+
+    ops, unchanged = [], []
+    for meta_id, template_struct in structs.items():
+        content_hash = hashlib.sha256(dumps(template_struct)).hexdigest()
+        if stored.get(meta_id) == content_hash:
+            unchanged.append(meta_id)
+            continue
+        ops.append(UpdateOne(
+            {"meta_id": meta_id},
+            {
+                "$set": {**template_struct, "content_hash": content_hash},
+                # $max so an overlapping older sync never moves the stamp backwards
+                "$max": {"last_synced_at": synced_at},
+                "$setOnInsert": {"created_at": synced_at},
+            },
+            upsert=True,
+        ))
+    if unchanged:
+        # Only the stamp moves; it marks the template as still present on Meta
+        ops.append(UpdateMany({"meta_id": {"$in": unchanged}}, {"$max": {"last_synced_at": synced_at}}))
+    await db["templates"].bulk_write(ops, ordered=False)
+    return len(structs) - len(unchanged), len(unchanged)
+
+
 async def sync_templates_from_meta(db):
     """Fetch templates from Meta API and store/update in MongoDB"""
     url = f"https://graph.facebook.com/{settings.WHATSAPP_API_VERSION}/{settings.WHATSAPP_WABA_ID}/message_templates"
     headers = {"Authorization": f"Bearer {settings.WHATSAPP_ACCESS_TOKEN}"}
+    params = {"limit": TEMPLATE_SYNC_PAGE_SIZE}
 
-    async with httpx.AsyncClient() as client:
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        pending = set()
         try:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-
-            templates_collection = db["templates"]
-            synced_count = 0
-            current_time = datetime.utcnow()
-
-            # Get list of current template IDs from Meta
-            meta_template_ids = set()
-
-            for item in data.get("data", []):
-                meta_template_id = item.get("id")
-                meta_template_ids.add(meta_template_id)
-
-                template_struct = {
-                    "name": item.get("name"),
-                    "language": item.get("language"),
-                    "category": item.get("category"),
-                    "meta_id": meta_template_id,
-                    "status": item.get("status"),
-                    "components": [],
-                }
-
-                for component in item.get("components", []):
-                    comp_type = component.get("type")
-
-                    if comp_type == "BODY":
-                        text = component.get("text", "")
-                        param_count = text.count("{{")
-                        template_struct["components"].append(
-                            {"type": "BODY", "text": text, "parameter_count": param_count}
-                        )
-
-                    elif comp_type == "HEADER":
-                        fmt = component.get("format")
-                        text = component.get("text", "")
-                        param_count = text.count("{{") if fmt == "TEXT" else 0
-                        template_struct["components"].append(
-                            {"type": "HEADER", "format": fmt, "text": text, "parameter_count": param_count}
-                        )
-
-                    elif comp_type == "BUTTONS":
-                        buttons = component.get("buttons", [])
-                        template_struct["components"].append({"type": "BUTTONS", "buttons": buttons})
-
-                # Upsert template (update if exists, insert if new)
-                await templates_collection.update_one(
-                    {"meta_id": meta_template_id},
-                    {
-                        "$set": {
-                            **template_struct,
-                            "last_synced_at": current_time,
-                        },
-                        "$setOnInsert": {"created_at": current_time}
-                    },
-                    upsert=True
-                )
-                synced_count += 1
-
-            # Delete templates that no longer exist in Meta
-            delete_result = await templates_collection.delete_many(
-                {"meta_id": {"$nin": list(meta_template_ids)}}
+            # BSON dates keep milliseconds; truncating keeps the stale-template cutoff exact
+            now = utcnow()
+            current_time = now.replace(microsecond=now.microsecond // 1000 * 1000)
+            written = unchanged = 0
+
+            # paging.next only arrives with each page, so fetching is sequential; the next page is
+            # fetched while up to TEMPLATE_SYNC_WRITE_FANOUT earlier pages are still being written
+            while url:
+                response = await client.get(url, headers=headers, params=params)
+                response.raise_for_status()
+                data = response.json()
+
+                if len(pending) >= TEMPLATE_SYNC_WRITE_FANOUT:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        page_written, page_unchanged = task.result()
+                        written += page_written
+                        unchanged += page_unchanged
+                pending.add(asyncio.create_task(_write_template_page(db, data.get("data", []), current_time)))
+
+                # The next link already carries the cursor and limit
+                url, params = (data.get("paging") or {}).get("next"), None
+
+            for page_written, page_unchanged in await asyncio.gather(*pending):
+                written += page_written
+                unchanged += page_unchanged
+            pending = set()
+
+            # Every template still on Meta was stamped above; anything older is gone
+            delete_result = await db["templates"].delete_many(
+                {"$or": [{"last_synced_at": {"$lt": current_time}}, {"last_synced_at": None}]}
             )
 
+            dashboard_stats_cache.invalidate_templates()
+
             return {
-                "synced": synced_count,
+                "synced": written + unchanged,
+                "updated": written,
+                "unchanged": unchanged,
                 "deleted": delete_result.deleted_count,
                 "last_synced_at": utc_to_ist(current_time).isoformat()
             }
@@ -104,6 +166,9 @@ async def sync_templates_from_meta(db):
         except Exception as exc:
             print(f"Unexpected error during sync: {str(exc)}")
             raise HTTPException(status_code=500, detail=str(exc))
+        finally:
+            for task in pending:
+                task.cancel()
 
 
 @router.post("/templates/sync")
@@ -141,10 +206,10 @@ async def get_templates(current_user: UserPublic = Depends(get_current_user), db
             "created_at": utc_to_ist(template.get("created_at")).isoformat() if template.get("created_at") else None,
         })
     
-    return {
+    return AppJSONResponse({
         "templates": result,
         "last_synced_at": utc_to_ist(last_synced_at).isoformat() if last_synced_at else None
-    }
+    })
 
 
 @router.get("/templates/{template_id}")
@@ -268,5 +333,100 @@ async def delete_template(name: str, current_user: UserPublic = Depends(get_curr
 
 
 @router.post("/send-template")
-async def send_template(req: TemplateRequest, current_user: UserPublic = Depends(get_current_user), db = Depends(get_db)):
-    return await send_template_message(req, db=db, user_id=current_user.id)
+async def send_template(
+    req: TemplateRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: UserPublic = Depends(get_current_user),
+    db = Depends(get_db),
+):
+    """Queue a template message; delivery status follows over the socket (message_status_batch)"""
+    if not req.phone or not req.template_name:
+        raise HTTPException(status_code=400, detail="Phone and template name are required")
+
+    stored = await claim_key(db, current_user.id, "send-template", idempotency_key, req.model_dump())
+    if stored is not None:
+        return stored
+
+    now = utcnow()
+    message_doc = {
+        "chatId": req.phone,
+        "senderId": current_user.id,
+        "receiverId": req.phone,
+        "owner": current_user.id,
+        "direction": "outgoing",
+        "text": template_preview_text(req),
+        "status": "sending",
+        "messageType": "template",
+        "templateName": req.template_name,
+        "createdAt": now,
+        "updatedAt": now,
+        "whatsappMessageId": None,
+    }
+    try:
+        await enqueue_message(db, current_user.id, message_doc, "template", req.model_dump())
+    except Exception:
+        await release_key(db, current_user.id, "send-template", idempotency_key)
+        raise
+
+    result = {"success": True, "queued": True, "message": serialize_message(message_doc)}
+    await complete_key(db, current_user.id, "send-template", idempotency_key, result)
+    await emit_to_user("new_message", result["message"], current_user.id)
+    return result
+
+
+async def _bulk_results(items, db, user_id: str):
+    """Send items with a few concurrent workers and yield NDJSON lines in completion order"""
+    results: asyncio.Queue = asyncio.Queue()
+    pending = iter(enumerate(items))
+
+    async def worker(client: httpx.AsyncClient):
+        for index, item in pending:
+            line = {"index": index, "phone": item.phone, "template_name": item.template_name}
+            try:
+                res = await send_template_message(item, db=db, user_id=user_id, client=client)
+            except HTTPException as exc:
+                res = {"success": False, "error": "Invalid request", "details": {"message": exc.detail}}
+            except Exception as exc:
+                res = {"success": False, "error": "Unexpected error", "details": {"message": str(exc)}}
+            if res.get("success"):
+                messages = res["whatsapp_response"].get("messages") or [{}]
+                line.update(success=True, whatsappMessageId=messages[0].get("id"))
+            else:
+                line.update(success=False, error=res.get("error"), details=res.get("details"))
+            await results.put(line)
+
+    sent = failed = 0
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        workers = [asyncio.create_task(worker(client)) for _ in range(min(settings.BULK_SEND_CONCURRENCY, len(items)))]
+        try:
+            for _ in range(len(items)):
+                line = await results.get()
+                if line["success"]:
+                    sent += 1
+                else:
+                    failed += 1
+                yield dumps(line) + b"\n"
+        finally:
+            # Client disconnects stop the remaining sends
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+    yield dumps({"summary": {"total": len(items), "sent": sent, "failed": failed}}) + b"\n"
+
+
+@router.post("/send-template/bulk")
+async def send_template_bulk(
+    req: BulkTemplateRequest,
+    current_user: UserPublic = Depends(get_current_user),
+    db = Depends(get_db),
+):
+    """
+    Send many template messages in one request through the shared send limiter.
+    Streams one NDJSON line per item ({"index", "success", ...}) as it completes, then a summary line.
+    """
+    if not req.items:
+        raise HTTPException(status_code=400, detail="At least one item is required")
+    if len(req.items) > settings.BULK_SEND_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BULK_SEND_MAX_ITEMS} items per request")
+
+    return StreamingResponse(_bulk_results(req.items, db, current_user.id), media_type="application/x-ndjson")
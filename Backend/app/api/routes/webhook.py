@@ -1,10 +1,15 @@
-from datetime import datetime
-
 from fastapi import APIRouter, Depends, Request
 from fastapi.responses import PlainTextResponse
 
+from app.core.dates import serialize_message, utcnow
+from app.core.responses import loads as json_loads
 from app.db.mongo import get_db
-from app.sockets import get_socket_for_user, sio
+from app.services.contact_directory import contact_directory
+from app.services.contacts import record_inbound
+from app.services.conversations import record_message, record_status
+from app.services.message_cache import message_cache
+from app.services.tenants import tenant_directory
+from app.sockets import emit_to_user, status_buffer
 from config import settings
 
 router = APIRouter(tags=["webhook"])
@@ -26,13 +31,16 @@ async def verify(request: Request):
 @router.post("/webhook")
 async def webhook_received(request: Request, db=Depends(get_db)):
     try:
-        data = await request.json()
+        data = json_loads(await request.body())
         print("RAW DATA =", data)
+        await db["webhook_events"].insert_one({"receivedAt": utcnow(), "payload": data})
 
         if data.get("entry"):
             for entry in data["entry"]:
                 for change in entry.get("changes", []):
                     value = change.get("value", {})
+                    phone_number_id = value.get("metadata", {}).get("phone_number_id")
+                    owner = tenant_directory.resolve(phone_number_id)
 
                     if value.get("messages"):
                         for msg in value["messages"]:
@@ -51,22 +59,35 @@ async def webhook_received(request: Request, db=Depends(get_db)):
 
                             RECEIVED_MESSAGES.append(message_data)
 
+                            now = utcnow()
                             incoming_msg_doc = {
                                 "chatId": msg.get("from"),
                                 "senderId": msg.get("from"),
-                                "receiverId": settings.WHATSAPP_PHONE_NUMBER_ID,
+                                "receiverId": phone_number_id or settings.WHATSAPP_PHONE_NUMBER_ID,
+                                "owner": owner,
                                 "direction": "incoming",
                                 "text": msg.get("text", {}).get("body", ""),
                                 "status": "delivered",
-                                "createdAt": datetime.utcnow().isoformat(),
-                                "updatedAt": datetime.utcnow().isoformat(),
+                                "createdAt": now,
+                                "updatedAt": now,
                                 "whatsappMessageId": msg.get("id"),
                             }
                             await db["messages"].insert_one(incoming_msg_doc)
-                            incoming_msg_doc["id"] = str(incoming_msg_doc.pop("_id"))
-
-                            await sio.emit("new_message", incoming_msg_doc)
-                            print("📨 Emitted incoming message to all users")
+                            contact_name = (message_data.get("contact") or {}).get("profile", {}).get("name")
+                            await record_message(db, owner, incoming_msg_doc, contact_name)
+                            await record_inbound(db, owner, msg.get("from"), now)
+                            message_cache.append(owner, incoming_msg_doc)
+
+                            if owner:
+                                payload = serialize_message(incoming_msg_doc)
+                                # Saved contact for the sender, usually answered from memory
+                                contact = await contact_directory.get(db, owner, msg.get("from"))
+                                payload["contactId"] = contact["id"] if contact else None
+                                payload["contactName"] = (contact and contact["name"]) or contact_name
+                                await emit_to_user("new_message", payload, owner)
+                                print(f"📨 Emitted incoming message to user {owner}")
+                            else:
+                                print(f"⚠️ No owner for phone number {phone_number_id}, message stored without emit")
 
                     if value.get("statuses"):
                         for status_update in value["statuses"]:
@@ -84,20 +105,22 @@ async def webhook_received(request: Request, db=Depends(get_db)):
                             new_status = status_update.get("status")
 
                             if whatsapp_msg_id and new_status:
+                                # wamids are globally unique; the sender (not the number's owner) gets the update
                                 result = await db["messages"].find_one_and_update(
                                     {"whatsappMessageId": whatsapp_msg_id},
                                     {
                                         "$set": {
                                             "status": new_status,
-                                            "updatedAt": datetime.utcnow().isoformat(),
+                                            "updatedAt": utcnow(),
                                         }
                                     },
                                     return_document=True,
                                 )
 
                                 if result:
-                                    sender_id = result.get("senderId")
-                                    sender_socket = get_socket_for_user(sender_id)
+                                    sender_id = result.get("owner") or result.get("senderId")
+                                    await record_status(db, result.get("owner"), result)
+                                    message_cache.update_status(result.get("owner"), result)
 
                                     status_event = {
                                         "messageId": str(result["_id"]),
@@ -106,11 +129,8 @@ async def webhook_received(request: Request, db=Depends(get_db)):
                                         "timestamp": status_update.get("timestamp"),
                                     }
 
-                                    if sender_socket:
-                                        await sio.emit("message_status_update", status_event, to=sender_socket)
-                                        print(f"✅ Emitted status update to user {sender_id}: {new_status}")
-                                    else:
-                                        print(f"⚠️ User {sender_id} not connected, DB updated with status: {new_status}")
+                                    # Coalesced with other updates for this user and flushed as message_status_batch
+                                    status_buffer.add(sender_id, status_event)
 
                     if len(RECEIVED_MESSAGES) > 100:
                         RECEIVED_MESSAGES.pop(0)
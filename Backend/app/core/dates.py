@@ -0,0 +1,46 @@
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+
+def utcnow() -> datetime:
+    """Naive UTC timestamp, stored by pymongo as a BSON date"""
+    return datetime.utcnow()
+
+
+def to_iso(value: Any) -> Optional[str]:
+    """Render a stored timestamp for the API; legacy ISO strings pass through unchanged"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """Client-supplied datetimes may carry an offset; stored dates are naive UTC"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_iso(value: Any) -> Any:
+    """Inverse of to_iso for legacy string timestamps; anything unparseable is returned as-is"""
+    if isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value
+        return to_naive_utc(parsed)
+    return value
+
+
+MESSAGE_DATE_FIELDS = ("createdAt", "updatedAt")
+
+
+def serialize_message(doc: dict) -> dict:
+    """Message document -> JSON-safe dict for HTTP responses and socket emits"""
+    out = dict(doc)
+    if "_id" in out:
+        out["id"] = str(out.pop("_id"))
+    for field in MESSAGE_DATE_FIELDS:
+        if field in out:
+            out[field] = to_iso(out[field])
+    return out
@@ -0,0 +1,61 @@
+"""
+Password hashing pool
+pbkdf2 takes tens of milliseconds per call; running it on the event loop stalls every other
+request. Calls go to a small dedicated thread pool instead, and queue/run times are recorded.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from app.core.metrics import register_collector
+from config import settings
+
+
+class HashingPool:
+    """Fixed-size executor; at most `workers` hashes run at once and the rest wait in its queue"""
+
+    def __init__(self, workers: int):
+        self._workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self.calls = 0
+        self.in_flight = 0
+        self.queue_seconds = 0.0
+        self.max_queue_seconds = 0.0
+        self.run_seconds = 0.0
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            return fn(*args), started, time.perf_counter()
+
+        self.in_flight += 1
+        try:
+            result, started, finished = await asyncio.get_running_loop().run_in_executor(self._executor, job)
+        finally:
+            self.in_flight -= 1
+        # Counters are only touched on the loop thread
+        waited = started - submitted
+        self.calls += 1
+        self.queue_seconds += waited
+        self.max_queue_seconds = max(self.max_queue_seconds, waited)
+        self.run_seconds += finished - started
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "workers": self._workers,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "avg_queue_ms": round(self.queue_seconds / self.calls * 1000, 2) if self.calls else None,
+            "max_queue_ms": round(self.max_queue_seconds * 1000, 2),
+            "avg_run_ms": round(self.run_seconds / self.calls * 1000, 2) if self.calls else None,
+        }
+
+
+# Singleton instance
+hashing_pool = HashingPool(workers=settings.PASSWORD_HASH_WORKERS)
+register_collector("password_hashing", hashing_pool.stats)
@@ -0,0 +1,12 @@
+from typing import Callable, Dict
+
+# name -> zero-arg callable returning a JSON-safe dict, collected by GET /metrics
+_collectors: Dict[str, Callable[[], dict]] = {}
+
+
+def register_collector(name: str, collector: Callable[[], dict]):
+    _collectors[name] = collector
+
+
+def collect() -> Dict[str, dict]:
+    return {name: collector() for name, collector in _collectors.items()}
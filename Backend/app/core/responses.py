@@ -0,0 +1,36 @@
+"""
+Fast JSON layer
+orjson for response bodies and the webhook request path. Handlers that already build plain,
+trusted dicts return AppJSONResponse directly, which skips jsonable_encoder and response_model
+re-validation.
+"""
+
+from typing import Any
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import ORJSONResponse
+
+JSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    # datetimes are native to orjson and render like to_iso (isoformat, no offset for naive UTC)
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=JSON_OPTIONS)
+
+
+def loads(raw: bytes) -> Any:
+    return orjson.loads(raw)
+
+
+class AppJSONResponse(ORJSONResponse):
+    """Default response class for the app"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
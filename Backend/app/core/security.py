@@ -1,5 +1,5 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 
 from bson import ObjectId
 from fastapi import Depends, HTTPException, Request, status
@@ -8,12 +8,21 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
+from app.core.dates import to_iso
+from app.core.hashing import hashing_pool
 from config import settings
 from models import UserPublic
 from app.db.mongo import get_db
+from app.services.principals import principal_cache
 from app.services.users import get_user_by_email
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=settings.PASSWORD_HASH_ROUNDS,
+    # Hashes with fewer rounds report needs_update, so raising the setting upgrades them on login
+    pbkdf2_sha256__min_rounds=settings.PASSWORD_HASH_ROUNDS,
+)
 security = HTTPBearer(auto_error=False)
 TOKEN_COOKIE_NAME = "access_token"
 
@@ -22,16 +31,21 @@ def sanitize_user(user_doc) -> UserPublic:
     return UserPublic(
         id=str(user_doc["_id"]),
         email=user_doc["email"],
-        created_at=user_doc["created_at"],
+        created_at=to_iso(user_doc["created_at"]),
     )
 
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def hash_password(password: str) -> str:
+    return await hashing_pool.run(pwd_context.hash, password)
 
 
-def verify_password(password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(password, hashed_password)
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await hashing_pool.run(pwd_context.verify, password, hashed_password)
+
+
+async def verify_and_update_password(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(valid, replacement hash or None); the replacement is set when the stored hash is outdated"""
+    return await hashing_pool.run(pwd_context.verify_and_update, password, hashed_password)
 
 
 def create_access_token(subject: str, email: str) -> str:
@@ -40,6 +54,29 @@ def create_access_token(subject: str, email: str) -> str:
     return jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
 
 
+def decode_access_token_claims(raw_token: str) -> Optional[dict]:
+    """Return the claims of a valid access token, or None"""
+    try:
+        payload = jwt.decode(raw_token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("sub") is None or payload.get("email") is None:
+        return None
+    return payload
+
+
+def decode_access_token(raw_token: str) -> Optional[str]:
+    """Return the user id (sub) of a valid access token, or None"""
+    payload = decode_access_token_claims(raw_token)
+    return payload["sub"] if payload else None
+
+
+def request_token(request: Request, token: Optional[HTTPAuthorizationCredentials] = None) -> Optional[str]:
+    """Bearer token if present, otherwise the auth cookie"""
+    token_str = token.credentials if token else None
+    return token_str or request.cookies.get(TOKEN_COOKIE_NAME)
+
+
 def set_auth_cookie(response: JSONResponse, token: str):
     response.set_cookie(
         key=TOKEN_COOKIE_NAME,
@@ -60,26 +97,32 @@ async def authenticate_user(email: str, password: str, db):
     user = await get_user_by_email(email, db)
     if not user:
         return None
-    if not verify_password(password, user["hashed_password"]):
+    valid, new_hash = await verify_and_update_password(password, user["hashed_password"])
+    if not valid:
         return None
+    if new_hash:
+        # Guarded on the old hash so a concurrent password change is never overwritten
+        await db["users"].update_one(
+            {"_id": user["_id"], "hashed_password": user["hashed_password"]},
+            {"$set": {"hashed_password": new_hash}},
+        )
     return user
 
 
 async def get_current_user(request: Request, token: Optional[HTTPAuthorizationCredentials] = Depends(security), db=Depends(get_db)) -> UserPublic:
-    token_str = token.credentials if token else None
-    raw_token = token_str or request.cookies.get(TOKEN_COOKIE_NAME)
+    raw_token = request_token(request, token)
 
     if not raw_token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
 
-    try:
-        payload = jwt.decode(raw_token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
-        user_id: str = payload.get("sub")
-        email: str = payload.get("email")
-        if user_id is None or email is None:
-            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    except JWTError:
+    cached = principal_cache.get(raw_token)
+    if cached is not None:
+        return cached
+
+    claims = decode_access_token_claims(raw_token)
+    if claims is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    user_id = claims["sub"]
 
     try:
         object_id = ObjectId(user_id)
@@ -90,4 +133,6 @@ async def get_current_user(request: Request, token: Optional[HTTPAuthorizationCr
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
-    return sanitize_user(user)
+    principal = sanitize_user(user)
+    principal_cache.put(raw_token, principal, claims.get("exp"))
+    return principal
@@ -0,0 +1,281 @@
+"""
+Declarative index registry
+INDEXES is reconciled against the database at startup; CANONICAL_QUERIES backs the
+explain() diagnostics (python -m app.db.indexes, or INDEX_DIAGNOSTICS=true at startup)
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.db.migrations import merge_duplicate_contacts
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "messages": [
+        # Keyset pagination for GET /messages, with and without a chatId
+        IndexModel(
+            [("owner", ASCENDING), ("chatId", ASCENDING), ("createdAt", ASCENDING), ("_id", ASCENDING)],
+            name="owner_chat_created",
+        ),
+        IndexModel([("owner", ASCENDING), ("createdAt", ASCENDING), ("_id", ASCENDING)], name="owner_created"),
+        # Status webhooks look messages up by Meta's wamid
+        IndexModel([("whatsappMessageId", ASCENDING)], name="whatsapp_message_id"),
+        # GET /search/messages; the owner prefix keeps each tenant's postings together
+        IndexModel([("owner", ASCENDING), ("text", TEXT)], name="owner_text", default_language="none"),
+    ],
+    "messages_archive": [
+        IndexModel([("owner", ASCENDING), ("chatId", ASCENDING), ("day", DESCENDING)], name="owner_chat_day"),
+        IndexModel([("owner", ASCENDING), ("day", DESCENDING)], name="owner_day"),
+    ],
+    # Transient data expires on its own
+    "webhook_events": [
+        IndexModel(
+            [("receivedAt", ASCENDING)],
+            name="received_ttl",
+            expireAfterSeconds=settings.WEBHOOK_JOURNAL_TTL_DAYS * 86400,
+        ),
+    ],
+    "outbox": [
+        IndexModel([("status", ASCENDING), ("priority", ASCENDING), ("available_at", ASCENDING)], name="status_available"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease"),
+    ],
+    "idempotency_keys": [
+        IndexModel([("createdAt", ASCENDING)], name="created_ttl", expireAfterSeconds=settings.IDEMPOTENCY_TTL_HOURS * 3600),
+    ],
+    "conversations": [
+        IndexModel([("owner", ASCENDING), ("chatId", ASCENDING)], name="owner_chat", unique=True),
+        IndexModel(
+            [("owner", ASCENDING), ("lastActivityAt", DESCENDING), ("_id", DESCENDING)],
+            name="owner_last_activity",
+        ),
+    ],
+    "contacts": [
+        # Keyset pages sort on (created_at, _id); both keys are indexed so no page sorts in memory
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], name="user_created"),
+        # Keyset pages of one list (GET /contacts?list_id, GET /contacts/lists/{id}/contacts)
+        IndexModel(
+            [("user_id", ASCENDING), ("list_ids", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_lists_created",
+        ),
+        # GET /search/contacts; unique so import upserts and concurrent creates can't duplicate a phone
+        IndexModel([("user_id", ASCENDING), ("phone", ASCENDING)], name="user_phone", unique=True),
+        IndexModel([("user_id", ASCENDING), ("name", TEXT)], name="user_name_text", default_language="none"),
+        # Recency segments ("messaged us within N days"); also webhook last_inbound_at stamps via user_phone
+        IndexModel([("user_id", ASCENDING), ("last_inbound_at", DESCENDING)], name="user_last_inbound"),
+    ],
+    "segments": [
+        IndexModel([("user_id", ASCENDING), ("name", ASCENDING)], name="user_name"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created"),
+    ],
+    "import_jobs": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created"),
+    ],
+    "contact_lists": [
+        IndexModel([("user_id", ASCENDING), ("name", ASCENDING)], name="user_name"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created"),
+    ],
+    "broadcasts": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="user_created"),
+    ],
+    "templates": [
+        IndexModel([("meta_id", ASCENDING)], name="meta_id", unique=True),
+        IndexModel([("created_at", DESCENDING)], name="created"),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email", unique=True),
+        IndexModel([("facebook_id", ASCENDING)], name="facebook_id", unique=True, sparse=True),
+    ],
+    "whatsapp_credentials": [
+        IndexModel([("user_id", ASCENDING)], name="user_id", unique=True),
+        IndexModel([("phone_number_id", ASCENDING)], name="phone_number_id"),
+    ],
+}
+
+
+# Representative query per hot route: (label, collection, filter, sort)
+_SAMPLE_USER = str(ObjectId())
+_SAMPLE_USER_OID = ObjectId(_SAMPLE_USER)
+
+CANONICAL_QUERIES = [
+    ("GET /messages", "messages", {"owner": _SAMPLE_USER, "chatId": "15550000000"}, [("createdAt", -1), ("_id", -1)]),
+    ("GET /messages (all chats)", "messages", {"owner": _SAMPLE_USER}, [("createdAt", -1), ("_id", -1)]),
+    ("POST /webhook (status)", "messages", {"whatsappMessageId": "wamid.sample"}, None),
+    ("GET /messages (archive)", "messages_archive", {"owner": _SAMPLE_USER, "chatId": "15550000000"}, [("day", -1)]),
+    ("GET /search/messages", "messages", {"owner": _SAMPLE_USER, "$text": {"$search": '"invoice"'}}, None),
+    ("GET /search/contacts", "contacts", {"user_id": _SAMPLE_USER_OID, "phone": {"$regex": "^9198"}}, [("created_at", -1)]),
+    ("GET /conversations", "conversations", {"owner": _SAMPLE_USER}, [("lastActivityAt", -1), ("_id", -1)]),
+    ("GET /contacts", "contacts", {"user_id": _SAMPLE_USER_OID}, [("created_at", -1), ("_id", -1)]),
+    ("GET /contacts?list_id", "contacts", {"user_id": _SAMPLE_USER_OID, "list_ids": ObjectId()}, [("created_at", -1), ("_id", -1)]),
+    ("POST /contacts/lists", "contact_lists", {"user_id": _SAMPLE_USER_OID, "name": "sample"}, None),
+    ("GET /contacts/lists", "contact_lists", {"user_id": _SAMPLE_USER_OID}, [("created_at", -1)]),
+    ("GET /segments", "segments", {"user_id": _SAMPLE_USER_OID}, [("created_at", -1)]),
+    ("POST /segments/preview (recency)", "contacts", {"user_id": _SAMPLE_USER_OID, "last_inbound_at": {"$gte": datetime(2024, 1, 1)}}, None),
+    ("GET /broadcasts", "broadcasts", {"user_id": _SAMPLE_USER}, [("created_at", -1)]),
+    ("POST /templates/sync", "templates", {"meta_id": "0"}, None),
+    ("GET /templates", "templates", {}, [("created_at", -1)]),
+    ("POST /auth/login", "users", {"email": "sample@example.com"}, None),
+    ("POST /auth/facebook/callback", "users", {"facebook_id": "0"}, None),
+    ("GET /profile", "whatsapp_credentials", {"user_id": _SAMPLE_USER}, None),
+]
+
+
+# Existing index with the registry's name but other keys or options
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+DUPLICATE_KEY = 11000
+
+
+async def _dedupe_conversations(db) -> int:
+    """Fold duplicate (owner, chatId) summaries into the most recently active one"""
+    removed = 0
+    pipeline = [
+        {"$sort": {"lastActivityAt": -1, "_id": -1}},
+        {"$group": {"_id": {"owner": "$owner", "chatId": "$chatId"}, "ids": {"$push": "$_id"}, "unread": {"$sum": "$unreadCount"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ]
+    async for group in db["conversations"].aggregate(pipeline, allowDiskUse=True):
+        keep, extra = group["ids"][0], group["ids"][1:]
+        await db["conversations"].update_one({"_id": keep}, {"$set": {"unreadCount": group["unread"]}})
+        res = await db["conversations"].delete_many({"_id": {"$in": extra}})
+        removed += res.deleted_count
+    return removed
+
+
+async def _dedupe_templates(db) -> int:
+    """Keep the most recently synced copy of each Meta template"""
+    removed = 0
+    pipeline = [
+        {"$sort": {"last_synced_at": -1, "_id": -1}},
+        {"$group": {"_id": "$meta_id", "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ]
+    async for group in db["templates"].aggregate(pipeline, allowDiskUse=True):
+        res = await db["templates"].delete_many({"_id": {"$in": group["ids"][1:]}})
+        removed += res.deleted_count
+    return removed
+
+
+# Unique indexes whose duplicates are safe to merge automatically; others must be fixed by hand
+DEDUPERS = {
+    ("conversations", "owner_chat"): _dedupe_conversations,
+    ("templates", "meta_id"): _dedupe_templates,
+    ("contacts", "user_phone"): merge_duplicate_contacts,
+}
+
+
+async def _create_index(db, collection: str, model: IndexModel):
+    name = model.document["name"]
+    try:
+        await db[collection].create_indexes([model])
+    except OperationFailure as exc:
+        if exc.code not in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+            raise
+        # The registry changed this index's definition; rebuild it under the same name
+        logger.warning(f"Rebuilding index {name} on {collection}: {exc}")
+        await db[collection].drop_index(name)
+        await db[collection].create_indexes([model])
+
+
+async def ensure_unique_indexes(db):
+    """
+    Build every unique index before requests are served, so upserts can't race in duplicates.
+    Mergeable duplicates are folded and the build retried; anything else stops startup.
+    """
+    for collection, models in INDEXES.items():
+        for model in models:
+            if not model.document.get("unique"):
+                continue
+            name = model.document["name"]
+            try:
+                await _create_index(db, collection, model)
+            except OperationFailure as exc:
+                dedupe = DEDUPERS.get((collection, name))
+                if exc.code != DUPLICATE_KEY or dedupe is None:
+                    raise RuntimeError(f"Unique index {name} on {collection} could not be built: {exc}") from exc
+                removed = await dedupe(db)
+                logger.warning(f"Merged {removed} duplicate {collection} documents to build unique index {name}")
+                await _create_index(db, collection, model)
+
+
+async def reconcile_indexes(db, unique: bool = True):
+    """Create any missing registry index; safe to run on every start"""
+    for collection, models in INDEXES.items():
+        # One command per index so a single conflict doesn't block the rest
+        for model in models:
+            if model.document.get("unique") and not unique:
+                continue
+            try:
+                await _create_index(db, collection, model)
+            except OperationFailure as exc:
+                # Existing data violating a unique key
+                logger.warning(f"Index {model.document['name']} on {collection} not reconciled: {exc}")
+            except PyMongoError as exc:
+                logger.error(f"Index {model.document['name']} on {collection} failed: {exc}")
+
+        declared = {model.document["name"] for model in models} | {"_id_"}
+        existing = set((await db[collection].index_information()).keys())
+        extra = existing - declared
+        if extra:
+            logger.info(f"Indexes on {collection} not in registry (left untouched): {sorted(extra)}")
+
+
+def _plan_stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def explain_canonical_queries(db) -> List[dict]:
+    """Run explain() on each canonical query and flag collection scans"""
+    report = []
+    for label, collection, query, sort in CANONICAL_QUERIES:
+        cursor = db[collection].find(query).limit(50)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = (await cursor.explain()).get("queryPlanner", {}).get("winningPlan", {})
+        stages = [stage for stage in _plan_stages(plan) if stage]
+        collscan = "COLLSCAN" in stages
+        report.append({"route": label, "collection": collection, "stages": stages, "collscan": collscan})
+        if collscan:
+            logger.warning(f"COLLSCAN for {label} on {collection}: {' <- '.join(stages)}")
+    return report
+
+
+async def bootstrap_indexes(db):
+    """Background part of the startup build; unique indexes already exist (ensure_unique_indexes)"""
+    try:
+        await reconcile_indexes(db, unique=False)
+        if settings.INDEX_DIAGNOSTICS:
+            await explain_canonical_queries(db)
+    except PyMongoError as exc:
+        logger.error(f"Index bootstrap failed: {exc}", exc_info=True)
+
+
+async def _main():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    try:
+        db = client[settings.MONGODB_DB_NAME]
+        await reconcile_indexes(db)
+        for row in await explain_canonical_queries(db):
+            flag = "COLLSCAN" if row["collscan"] else "ok"
+            print(f"{flag:<9} {row['route']:<30} {' <- '.join(row['stages'])}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,284 @@
+"""
+Online data migrations
+Each migration is idempotent and only touches documents still in the old shape
+"""
+
+import logging
+import re
+from typing import List, Set, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from app.core.dates import parse_iso
+from app.services.contacts import normalize_phone
+from app.services.list_counts import BACKFILL_STATE_ID, refresh_list_count
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def backfill_message_owners(db):
+    """Assign the tenant scope to messages written before the owner field existed"""
+    outgoing = await db["messages"].update_many(
+        {"owner": {"$exists": False}, "direction": "outgoing"},
+        [{"$set": {"owner": "$senderId"}}],
+    )
+
+    incoming_count = 0
+    async for cred in db["whatsapp_credentials"].find({}, {"user_id": 1, "phone_number_id": 1}):
+        res = await db["messages"].update_many(
+            {"owner": {"$exists": False}, "direction": "incoming", "receiverId": cred.get("phone_number_id")},
+            {"$set": {"owner": cred.get("user_id")}},
+        )
+        incoming_count += res.modified_count
+    if settings.WHATSAPP_DEFAULT_OWNER_ID:
+        res = await db["messages"].update_many(
+            {"owner": {"$exists": False}, "direction": "incoming", "receiverId": settings.WHATSAPP_PHONE_NUMBER_ID},
+            {"$set": {"owner": settings.WHATSAPP_DEFAULT_OWNER_ID}},
+        )
+        incoming_count += res.modified_count
+
+    if outgoing.modified_count or incoming_count:
+        logger.info(f"Backfilled owner on {outgoing.modified_count} outgoing and {incoming_count} incoming messages")
+
+
+async def backfill_conversations(db):
+    """Seed the conversations collection from message history (only fills chats it doesn't know yet)"""
+    state_id = "backfill_conversations"
+    # Live traffic may create conversations before this runs, so completion is tracked explicitly
+    # rather than inferred from an empty collection; keepExisting makes a rerun after a crash safe
+    if (await db["migration_state"].find_one({"_id": state_id}) or {}).get("done"):
+        return
+    pipeline = [
+        {"$match": {"owner": {"$ne": None}}},
+        {"$sort": {"createdAt": 1, "_id": 1}},
+        {
+            "$group": {
+                "_id": {"owner": "$owner", "chatId": "$chatId"},
+                "last": {"$last": "$$ROOT"},
+                "createdAt": {"$first": "$createdAt"},
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "owner": "$_id.owner",
+                "chatId": "$_id.chatId",
+                "lastMessage": {
+                    "id": {"$toString": "$last._id"},
+                    "text": "$last.text",
+                    "direction": "$last.direction",
+                    "status": "$last.status",
+                    "createdAt": "$last.createdAt",
+                },
+                "lastActivityAt": "$last.createdAt",
+                "createdAt": 1,
+                "unreadCount": {"$literal": 0},
+            }
+        },
+        {"$merge": {"into": "conversations", "on": ["owner", "chatId"], "whenMatched": "keepExisting", "whenNotMatched": "insert"}},
+    ]
+    await db["messages"].aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+    await db["migration_state"].update_one({"_id": state_id}, {"$set": {"done": True}}, upsert=True)
+
+
+# Timestamp fields historically written as datetime.isoformat() strings
+ISO_DATE_FIELDS = {
+    "messages": ["createdAt", "updatedAt"],
+    "conversations": ["createdAt", "updatedAt", "lastActivityAt", "lastMessage.createdAt"],
+    "contacts": ["created_at"],
+    "contact_lists": ["created_at"],
+    "broadcasts": ["created_at", "sent_at", "completed_at"],
+    "users": ["created_at", "last_login"],
+}
+ISO_DATE_BATCH_SIZE = 1000
+
+
+def _get_path(doc: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+async def migrate_iso_dates(db, collection: str, fields, batch_size: int = ISO_DATE_BATCH_SIZE):
+    """Convert string timestamps to BSON dates in _id order, checkpointing so a restart resumes"""
+    state_id = f"iso_dates:{collection}"
+    state = await db["migration_state"].find_one({"_id": state_id}) or {}
+    if state.get("done"):
+        return
+
+    last_id = state.get("last_id")
+    string_match = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {field: 1 for field in fields}
+    converted = 0
+
+    while True:
+        query = dict(string_match)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await db[collection].find(query, projection).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+
+        ops = []
+        for doc in batch:
+            updates = {}
+            for field in fields:
+                value = _get_path(doc, field)
+                parsed = parse_iso(value)
+                if parsed is not value:
+                    updates[field] = parsed
+            if updates:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": updates}))
+        if ops:
+            await db[collection].bulk_write(ops, ordered=False)
+            converted += len(ops)
+
+        last_id = batch[-1]["_id"]
+        await db["migration_state"].update_one({"_id": state_id}, {"$set": {"last_id": last_id}}, upsert=True)
+
+    await db["migration_state"].update_one({"_id": state_id}, {"$set": {"done": True}}, upsert=True)
+    if converted:
+        logger.info(f"Converted ISO string timestamps to dates on {converted} {collection} documents")
+
+
+async def _merge_contacts(db, keep: dict, duplicates: List[dict]) -> Set[Tuple[ObjectId, ObjectId]]:
+    """Fold duplicates into keep (memberships, attributes, timestamps) and delete them; returns touched (user, list) pairs"""
+    docs = [keep, *duplicates]
+    list_ids = list(dict.fromkeys(lid for d in docs for lid in d.get("list_ids", [])))
+    attributes = {}
+    # keep's own values win
+    for d in reversed(docs):
+        attributes.update(d.get("attributes") or {})
+    update = {"$set": {
+        "name": next((d["name"] for d in docs if d.get("name")), ""),
+        "list_ids": list_ids,
+        "attributes": attributes,
+    }}
+    created = [d["created_at"] for d in docs if d.get("created_at")]
+    if created:
+        update["$min"] = {"created_at": min(created)}
+    inbound = [d["last_inbound_at"] for d in docs if d.get("last_inbound_at")]
+    if inbound:
+        update["$max"] = {"last_inbound_at": max(inbound)}
+
+    await db["contacts"].update_one({"_id": keep["_id"]}, update)
+    await db["contacts"].delete_many({"_id": {"$in": [d["_id"] for d in duplicates]}})
+    return {(keep["user_id"], lid) for lid in list_ids}
+
+
+async def merge_duplicate_contacts(db) -> int:
+    """Merge contacts sharing (user_id, phone), keeping the oldest; returns the number removed"""
+    removed = 0
+    touched: Set[Tuple[ObjectId, ObjectId]] = set()
+    pipeline = [
+        {"$match": {"phone": {"$type": "string"}}},
+        {"$sort": {"created_at": 1, "_id": 1}},
+        {"$group": {"_id": {"user_id": "$user_id", "phone": "$phone"}, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ]
+    async for group in db["contacts"].aggregate(pipeline, allowDiskUse=True):
+        docs = {d["_id"]: d async for d in db["contacts"].find({"_id": {"$in": group["ids"]}})}
+        ordered = [docs[i] for i in group["ids"] if i in docs]
+        if len(ordered) < 2:
+            continue
+        touched |= await _merge_contacts(db, ordered[0], ordered[1:])
+        removed += len(ordered) - 1
+    for user_oid, list_oid in touched:
+        await refresh_list_count(db, user_oid, list_oid)
+    return removed
+
+
+# Already canonical: digits only, 7-15 long, no international 00 prefix (see normalize_phone)
+CANONICAL_PHONE = re.compile(r"^(?!00)[0-9]{7,15}$")
+
+
+async def normalize_contact_phones(db, batch_size: int = ISO_DATE_BATCH_SIZE):
+    """
+    Rewrite phones stored before normalize_phone existed, so imports, webhook stamps and
+    directory lookups match them; a contact colliding with an existing one is merged into it
+    """
+    state_id = "normalize_contact_phones"
+    state = await db["migration_state"].find_one({"_id": state_id}) or {}
+    if state.get("done"):
+        return
+
+    last_id = state.get("last_id")
+    rewritten = merged = invalid = 0
+    touched: Set[Tuple[ObjectId, ObjectId]] = set()
+    while True:
+        query = {"phone": {"$type": "string", "$not": CANONICAL_PHONE}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await db["contacts"].find(query).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+
+        for doc in batch:
+            phone = normalize_phone(doc["phone"])
+            if not phone:
+                invalid += 1
+                continue
+            try:
+                res = await db["contacts"].update_one({"_id": doc["_id"], "phone": doc["phone"]}, {"$set": {"phone": phone}})
+                rewritten += res.modified_count
+            except DuplicateKeyError:
+                existing = await db["contacts"].find_one({"user_id": doc["user_id"], "phone": phone})
+                if existing is None:
+                    continue
+                touched |= await _merge_contacts(db, existing, [doc])
+                merged += 1
+
+        last_id = batch[-1]["_id"]
+        await db["migration_state"].update_one({"_id": state_id}, {"$set": {"last_id": last_id}}, upsert=True)
+
+    for user_oid, list_oid in touched:
+        await refresh_list_count(db, user_oid, list_oid)
+    await db["migration_state"].update_one({"_id": state_id}, {"$set": {"done": True}}, upsert=True)
+    if rewritten or merged or invalid:
+        logger.info(f"Normalized {rewritten} contact phones, merged {merged} duplicates, left {invalid} unparseable")
+
+
+async def backfill_list_counts(db):
+    """
+    Count every list once after contact_count was introduced. All lists are recounted, not just
+    those missing the field, since an $inc before this ran starts the counter from zero.
+    """
+    state_id = BACKFILL_STATE_ID
+    state = await db["migration_state"].find_one({"_id": state_id}) or {}
+    if state.get("done"):
+        return
+
+    last_id = state.get("last_id")
+    counted = 0
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = await db["contact_lists"].find(query, {"user_id": 1}).sort("_id", 1).limit(ISO_DATE_BATCH_SIZE).to_list(length=ISO_DATE_BATCH_SIZE)
+        if not batch:
+            break
+        for lst in batch:
+            await refresh_list_count(db, lst["user_id"], lst["_id"])
+        counted += len(batch)
+        last_id = batch[-1]["_id"]
+        await db["migration_state"].update_one({"_id": state_id}, {"$set": {"last_id": last_id}}, upsert=True)
+
+    await db["migration_state"].update_one({"_id": state_id}, {"$set": {"done": True}}, upsert=True)
+    if counted:
+        logger.info(f"Backfilled contact_count on {counted} lists")
+
+
+async def run_migrations(db):
+    try:
+        # First: list views and single-list segment counts read contact_count directly
+        await backfill_list_counts(db)
+        for collection, fields in ISO_DATE_FIELDS.items():
+            await migrate_iso_dates(db, collection, fields)
+        await backfill_message_owners(db)
+        await backfill_conversations(db)
+        await normalize_contact_phones(db)
+    except PyMongoError as exc:
+        logger.error(f"Migration failed: {exc}", exc_info=True)
@@ -0,0 +1,40 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+
+def encode_cursor(sort_value: Any, object_id: ObjectId) -> str:
+    """Opaque keyset cursor for a (sort_value, _id) position"""
+    data = {"v": sort_value, "id": str(object_id)}
+    if isinstance(sort_value, datetime):
+        data = {"v": sort_value.isoformat(), "d": 1, "id": str(object_id)}
+    raw = json.dumps(data, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = datetime.fromisoformat(data["v"]) if data.get("d") else data["v"]
+        return value, ObjectId(data["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(field: str, cursor: Optional[str], direction: int) -> dict:
+    """Filter selecting documents strictly after the cursor in (field, _id) order; direction -1 walks backwards"""
+    if not cursor:
+        return {}
+    value, object_id = decode_cursor(cursor)
+    op = "$lt" if direction < 0 else "$gt"
+    return {
+        "$or": [
+            {field: {op: value}},
+            {field: value, "_id": {op: object_id}},
+        ]
+    }
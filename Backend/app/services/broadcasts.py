@@ -0,0 +1,88 @@
+"""
+Broadcast progress
+Each recipient is an outbox job; as the dispatcher settles one it records the outcome in the
+recipient's slot, moves the counters and publishes broadcast_progress. The last one completes it.
+"""
+
+import logging
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+from app.core.dates import utcnow
+from app.services.dashboard_stats import dashboard_stats_cache
+from app.sockets import emit_to_user
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = {"user_id": 1, "sent": 1, "failed": 1, "pending": 1, "status": 1}
+
+
+async def _publish(db, broadcast: dict):
+    """Emit the counters, completing the broadcast once nothing is pending"""
+    status = broadcast.get("status")
+    if broadcast["pending"] <= 0 and status == "sending":
+        res = await db["broadcasts"].update_one(
+            {"_id": broadcast["_id"], "status": "sending"},
+            {"$set": {"status": "completed", "completed_at": utcnow()}},
+        )
+        if res.modified_count:
+            status = "completed"
+            dashboard_stats_cache.invalidate(broadcast["user_id"])
+    try:
+        await emit_to_user(
+            "broadcast_progress",
+            {
+                "id": broadcast["_id"],
+                "status": status,
+                "sent": broadcast["sent"],
+                "failed": broadcast["failed"],
+                "pending": broadcast["pending"],
+            },
+            broadcast["user_id"],
+        )
+    except Exception as exc:
+        # Progress is stored; GET /broadcasts/{id} serves it if the live update is lost
+        logger.warning(f"broadcast_progress emit for {broadcast['_id']} failed: {exc}")
+
+
+async def record_recipient_result(
+    db, ref: dict, status: str, whatsapp_message_id: Optional[str], details: Optional[dict]
+):
+    """Settle one recipient of ref = {"id": broadcast id, "index": recipient index}"""
+    idx = ref["index"]
+    if status == "sent":
+        # Only the message id; the full Graph response would bloat the broadcast document
+        details = {"message_id": whatsapp_message_id}
+    # Guarded on the slot, so a redelivered job is never counted twice
+    broadcast = await db["broadcasts"].find_one_and_update(
+        {"_id": ref["id"], f"recipients.{idx}.status": "pending"},
+        {
+            "$set": {f"recipients.{idx}.status": status, f"recipients.{idx}.details": details},
+            "$inc": {status: 1, "pending": -1},
+        },
+        projection=COUNTERS,
+        return_document=ReturnDocument.AFTER,
+    )
+    if broadcast is not None:
+        await _publish(db, broadcast)
+
+
+async def fail_unqueued(db, broadcast_id: str, start: int, total: int, error: str):
+    """Mark recipients [start, total) failed when queueing stopped before reaching them"""
+    count = total - start
+    if count <= 0:
+        return
+    updates = {"error": error}
+    for idx in range(start, total):
+        updates[f"recipients.{idx}.status"] = "failed"
+        updates[f"recipients.{idx}.details"] = {"message": "Not queued"}
+    broadcast = await db["broadcasts"].find_one_and_update(
+        {"_id": broadcast_id},
+        {"$set": updates, "$inc": {"failed": count, "pending": -count}},
+        projection=COUNTERS,
+        return_document=ReturnDocument.AFTER,
+    )
+    if broadcast is not None:
+        # The queued jobs may all have finished already, leaving nobody else to complete it
+        await _publish(db, broadcast)
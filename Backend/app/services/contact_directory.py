@@ -0,0 +1,134 @@
+"""
+Phone -> contact directory
+Incoming messages and conversations only carry the chat's phone number; this keeps a per-tenant
+LRU of phone -> (contact id, name), including "no contact" answers, so the webhook and the inbox
+can attach saved contacts without a lookup per message. Contact writes forget the phones they
+touch; per process, so the TTL bounds staleness from writes handled by other workers.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from bson import ObjectId
+
+from app.core.metrics import register_collector
+from config import settings
+
+# (contact id, name), or None when the tenant has no contact with that phone
+Entry = Optional[Tuple[str, str]]
+
+
+class ContactDirectory:
+    """LRU of tenants, each holding an LRU of phone -> contact"""
+
+    def __init__(self, max_tenants: int, max_phones: int, ttl_seconds: float):
+        self._max_tenants = max_tenants
+        self._max_phones = max_phones
+        self._ttl = ttl_seconds
+        self._tenants: "OrderedDict[str, OrderedDict[str, Tuple[Entry, float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._ttl > 0 and self._max_tenants > 0 and self._max_phones > 0
+
+    def _cached(self, owner: str, phone: str) -> Tuple[bool, Entry]:
+        phones = self._tenants.get(owner)
+        entry = phones.get(phone) if phones is not None else None
+        if entry is None or time.monotonic() - entry[1] > self._ttl:
+            return False, None
+        phones.move_to_end(phone)
+        return True, entry[0]
+
+    def _put(self, owner: str, phone: str, value: Entry):
+        phones = self._tenants.get(owner)
+        if phones is None:
+            phones = self._tenants[owner] = OrderedDict()
+        self._tenants.move_to_end(owner)
+        phones[phone] = (value, time.monotonic())
+        phones.move_to_end(phone)
+        while len(phones) > self._max_phones:
+            phones.popitem(last=False)
+        while len(self._tenants) > self._max_tenants:
+            self._tenants.popitem(last=False)
+
+    async def lookup(self, db, owner: Optional[str], phones: Iterable[str]) -> Dict[str, dict]:
+        """{phone: {"id", "name"}} for the phones that belong to a saved contact of owner"""
+        found: Dict[str, dict] = {}
+        if not owner:
+            return found
+        try:
+            user_oid = ObjectId(owner)
+        except Exception:
+            return found
+
+        missing = []
+        for phone in dict.fromkeys(p for p in phones if p):
+            hit, value = self._cached(owner, phone) if self.enabled else (False, None)
+            if hit:
+                self.hits += 1
+                if value is not None:
+                    found[phone] = {"id": value[0], "name": value[1]}
+            else:
+                self.misses += 1
+                missing.append(phone)
+        if not missing:
+            return found
+
+        # One query for all misses, served by the (user_id, phone) index; the oldest contact wins on duplicates
+        resolved: Dict[str, Tuple[str, str]] = {}
+        cursor = db["contacts"].find(
+            {"user_id": user_oid, "phone": {"$in": missing}},
+            {"phone": 1, "name": 1},
+        ).sort("created_at", 1)
+        async for doc in cursor:
+            resolved.setdefault(doc["phone"], (str(doc["_id"]), doc.get("name", "")))
+        for phone in missing:
+            value = resolved.get(phone)
+            if self.enabled:
+                self._put(owner, phone, value)
+            if value is not None:
+                found[phone] = {"id": value[0], "name": value[1]}
+        return found
+
+    async def get(self, db, owner: Optional[str], phone: Optional[str]) -> Optional[dict]:
+        if not phone:
+            return None
+        return (await self.lookup(db, owner, [phone])).get(phone)
+
+    def forget(self, owner: str, phones: Iterable[Optional[str]]):
+        """A contact with one of these phones was created, renamed, re-numbered or deleted"""
+        entries = self._tenants.get(owner)
+        if entries is None:
+            return
+        for phone in phones:
+            if phone:
+                entries.pop(phone, None)
+
+    def invalidate_tenant(self, owner: str):
+        """Bulk writes (imports) whose individual phones aren't tracked"""
+        self._tenants.pop(owner, None)
+
+    def clear(self):
+        self._tenants.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "tenants": len(self._tenants),
+            "phones": sum(len(p) for p in self._tenants.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+# Singleton instance
+contact_directory = ContactDirectory(
+    max_tenants=settings.CONTACT_DIRECTORY_MAX_TENANTS,
+    max_phones=settings.CONTACT_DIRECTORY_MAX_PHONES,
+    ttl_seconds=settings.CONTACT_DIRECTORY_TTL_SECONDS,
+)
+register_collector("contact_directory", contact_directory.stats)
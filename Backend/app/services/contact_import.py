@@ -0,0 +1,219 @@
+"""
+Bulk contact import
+The upload is spooled to a temp file, then a background job reads it a chunk of rows at a time
+(CSV or XLSX), normalizes and de-duplicates phones, and upserts each chunk with one unordered
+bulk_write. Memory stays flat whatever the file size; progress is kept on the import_jobs doc.
+"""
+
+import asyncio
+import csv
+import logging
+import os
+import tempfile
+from typing import Iterator, List, Optional, Set
+
+import aiofiles
+from bson import ObjectId
+from fastapi import HTTPException, UploadFile
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.core.dates import utcnow
+from app.services.contact_directory import contact_directory
+from app.services.contacts import normalize_phone
+from app.services.dashboard_stats import dashboard_stats_cache
+from app.services.list_counts import refresh_list_count
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "import_jobs"
+CHUNK_ROWS = 1000
+UPLOAD_CHUNK_BYTES = 1 << 20
+PHONE_COLUMNS = ("phone", "phone number", "mobile", "mobile number", "number", "whatsapp", "whatsapp number")
+NAME_COLUMNS = ("name", "full name", "contact name", "customer name")
+
+# Running jobs, so they aren't garbage collected mid-import
+_tasks: Set[asyncio.Task] = set()
+
+
+class ImportFileError(Exception):
+    pass
+
+
+def _file_format(filename: Optional[str]) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    if ext in (".csv", ".txt"):
+        return "csv"
+    if ext == ".xlsx":
+        return "xlsx"
+    raise HTTPException(status_code=400, detail="Upload a .csv or .xlsx file")
+
+
+def _csv_rows(path: str) -> Iterator[List[str]]:
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as fh:
+        yield from csv.reader(fh)
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    # Spreadsheets store long numbers as floats; 919876543210.0 must not gain a digit
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _xlsx_rows(path: str) -> Iterator[List[str]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError("XLSX import requires openpyxl to be installed")
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield [_cell(v) for v in row]
+    finally:
+        workbook.close()
+
+
+def _take(rows: Iterator[List[str]], size: int) -> List[List[str]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            break
+    return chunk
+
+
+def _find_column(header: List[str], names) -> Optional[int]:
+    normalized = [h.strip().lower() for h in header]
+    for name in names:
+        if name in normalized:
+            return normalized.index(name)
+    return None
+
+
+def _chunk_ops(rows, phone_idx: int, name_idx: Optional[int], user_oid: ObjectId, list_oid: Optional[ObjectId], update_existing: bool):
+    """One upsert per distinct phone in the chunk; later rows win for the name"""
+    names = {}
+    invalid = duplicates = 0
+    for row in rows:
+        phone = normalize_phone(row[phone_idx]) if phone_idx < len(row) else None
+        if phone is None:
+            invalid += 1
+            continue
+        name = row[name_idx].strip() if name_idx is not None and name_idx < len(row) else ""
+        if phone in names:
+            duplicates += 1
+            name = name or names[phone]
+        names[phone] = name
+
+    now = utcnow()
+    ops = []
+    for phone, name in names.items():
+        on_insert = {"user_id": user_oid, "phone": phone, "created_at": now}
+        update = {"$setOnInsert": on_insert}
+        if update_existing and name:
+            update["$set"] = {"name": name}
+        else:
+            on_insert["name"] = name
+        if list_oid is not None:
+            update["$addToSet"] = {"list_ids": list_oid}
+        else:
+            on_insert["list_ids"] = []
+        # Matching existing contacts by phone makes re-imports and cross-chunk repeats idempotent
+        ops.append(UpdateOne({"user_id": user_oid, "phone": phone}, update, upsert=True))
+    return ops, invalid, duplicates
+
+
+async def _run_import(db, job_id: ObjectId, path: str, fmt: str, user_oid: ObjectId, list_oid: Optional[ObjectId], update_existing: bool):
+    jobs = db[COLLECTION]
+    rows = _xlsx_rows(path) if fmt == "xlsx" else _csv_rows(path)
+    try:
+        await jobs.update_one({"_id": job_id}, {"$set": {"status": "running", "started_at": utcnow()}})
+
+        # File reads and parsing run off the event loop, one chunk at a time
+        header = await asyncio.to_thread(next, rows, None)
+        if not header:
+            raise ImportFileError("The file is empty")
+        phone_idx = _find_column(header, PHONE_COLUMNS)
+        if phone_idx is None:
+            raise ImportFileError("No phone column found (expected a header such as 'phone' or 'mobile')")
+        name_idx = _find_column(header, NAME_COLUMNS)
+
+        while True:
+            chunk = await asyncio.to_thread(_take, rows, CHUNK_ROWS)
+            if not chunk:
+                break
+            ops, invalid, duplicates = _chunk_ops(chunk, phone_idx, name_idx, user_oid, list_oid, update_existing)
+            inserted = matched = 0
+            if ops:
+                result = await db["contacts"].bulk_write(ops, ordered=False)
+                inserted, matched = result.upserted_count, result.matched_count
+                # New contacts may replace cached "no contact" answers as soon as the chunk lands
+                contact_directory.invalidate_tenant(str(user_oid))
+            await jobs.update_one({"_id": job_id}, {"$inc": {
+                "processed": len(chunk),
+                "invalid": invalid,
+                "duplicates": duplicates,
+                "inserted": inserted,
+                "matched": matched,
+            }})
+
+        if list_oid is not None:
+            # Upserts don't say which matched contacts were already members, so recount once
+            await refresh_list_count(db, user_oid, list_oid)
+        await jobs.update_one({"_id": job_id}, {"$set": {"status": "completed", "finished_at": utcnow()}})
+        dashboard_stats_cache.invalidate(str(user_oid))
+    except (ImportFileError, UnicodeDecodeError, csv.Error) as exc:
+        await jobs.update_one({"_id": job_id}, {"$set": {"status": "failed", "error": str(exc), "finished_at": utcnow()}})
+    except PyMongoError as exc:
+        logger.error(f"Contact import {job_id} failed: {exc}", exc_info=True)
+        await jobs.update_one({"_id": job_id}, {"$set": {"status": "failed", "error": "Database error", "finished_at": utcnow()}})
+    except Exception as exc:
+        logger.error(f"Contact import {job_id} failed: {exc}", exc_info=True)
+        await jobs.update_one({"_id": job_id}, {"$set": {"status": "failed", "error": "Could not read the file", "finished_at": utcnow()}})
+    finally:
+        rows.close()
+        os.unlink(path)
+
+
+async def start_import(db, user_oid: ObjectId, upload: UploadFile, list_oid: Optional[ObjectId], update_existing: bool) -> dict:
+    """Spool the upload to disk and start the import job; returns the job document"""
+    fmt = _file_format(upload.filename)
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        async with aiofiles.open(path, "wb") as out:
+            while True:
+                data = await upload.read(UPLOAD_CHUNK_BYTES)
+                if not data:
+                    break
+                await out.write(data)
+        job = {
+            "user_id": user_oid,
+            "filename": upload.filename,
+            "format": fmt,
+            "list_id": list_oid,
+            "update_existing": update_existing,
+            "status": "queued",
+            "processed": 0,
+            "invalid": 0,
+            "duplicates": 0,
+            "inserted": 0,
+            "matched": 0,
+            "error": None,
+            "created_at": utcnow(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        res = await db[COLLECTION].insert_one(job)
+    except Exception:
+        os.unlink(path)
+        raise
+    job["_id"] = res.inserted_id
+
+    task = asyncio.create_task(_run_import(db, res.inserted_id, path, fmt, user_oid, list_oid, update_existing))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
@@ -0,0 +1,61 @@
+import re
+from datetime import datetime
+from typing import Optional
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.core.dates import to_naive_utc
+from models import ContactFilter
+
+NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_phone(raw: str) -> Optional[str]:
+    """
+    Canonical contact phone: international digits only, the same form WhatsApp uses for
+    wa_id / chatId ("+91 98765-43210" and "0091 9876543210" -> "919876543210").
+    Returns None when the result can't be a phone number.
+    """
+    value = (raw or "").strip()
+    if value.startswith("00"):
+        value = value[2:]
+    digits = NON_DIGITS.sub("", value)
+    if not 7 <= len(digits) <= 15:
+        return None
+    return digits
+
+
+def contact_filter_query(user_oid: ObjectId, contact_filter: ContactFilter) -> dict:
+    """Mongo query for a ContactFilter, shaped to use the (user_id, ...) contact indexes"""
+    clauses = [{"user_id": user_oid}]
+    if contact_filter.list_id:
+        try:
+            clauses.append({"list_ids": ObjectId(contact_filter.list_id)})
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid list id")
+    if contact_filter.phone_prefix:
+        digits = NON_DIGITS.sub("", contact_filter.phone_prefix)
+        if not digits:
+            raise HTTPException(status_code=400, detail="Invalid phone prefix")
+        clauses.append({"phone": {"$regex": f"^{digits}"}})
+    created = {}
+    if contact_filter.created_after:
+        created["$gte"] = to_naive_utc(contact_filter.created_after)
+    if contact_filter.created_before:
+        created["$lt"] = to_naive_utc(contact_filter.created_before)
+    if created:
+        clauses.append({"created_at": created})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+async def record_inbound(db, owner: Optional[str], phone: Optional[str], at: datetime):
+    """Stamp last_inbound_at on the owner's contacts for this phone (for recency segments)"""
+    if not owner or not phone:
+        return
+    try:
+        user_oid = ObjectId(owner)
+    except Exception:
+        return
+    # $max keeps out-of-order webhook deliveries from moving the stamp backwards
+    await db["contacts"].update_many({"user_id": user_oid, "phone": phone}, {"$max": {"last_inbound_at": at}})
@@ -0,0 +1,81 @@
+"""
+Conversation summaries for the inbox
+One document per (owner, chatId), maintained incrementally as messages are written
+"""
+
+from typing import List, Optional
+
+from pymongo import UpdateOne
+
+from app.core.dates import utcnow
+
+
+def _summary_update(message_doc: dict, contact_name: Optional[str] = None) -> list:
+    """
+    Update pipeline folding one message into its summary. Every expression reads the summary as
+    it was, so a late or out-of-order message still counts towards unread but never replaces a
+    newer lastMessage.
+    """
+    created_at = message_doc.get("createdAt")
+    last_message = {
+        "id": str(message_doc["_id"]),
+        "text": message_doc.get("text", ""),
+        "direction": message_doc.get("direction"),
+        "status": message_doc.get("status"),
+        "createdAt": created_at,
+    }
+    newest = {"$gte": [created_at, {"$ifNull": ["$lastActivityAt", created_at]}]}
+    unread = {"$ifNull": ["$unreadCount", 0]}
+    fields = {
+        "lastMessage": {"$cond": [newest, {"$literal": last_message}, "$lastMessage"]},
+        "lastActivityAt": {"$max": ["$lastActivityAt", created_at]},
+        "createdAt": {"$ifNull": ["$createdAt", created_at]},
+        "unreadCount": {"$add": [unread, 1]} if message_doc.get("direction") == "incoming" else unread,
+        "updatedAt": utcnow(),
+    }
+    if contact_name:
+        fields["contactName"] = {"$literal": contact_name}
+    return [{"$set": fields}]
+
+
+async def record_message(db, owner: Optional[str], message_doc: dict, contact_name: Optional[str] = None):
+    """Fold a freshly inserted message into its conversation summary"""
+    if not owner:
+        return
+
+    await db["conversations"].update_one(
+        {"owner": owner, "chatId": message_doc["chatId"]},
+        _summary_update(message_doc, contact_name),
+        upsert=True,
+    )
+
+
+async def record_messages(db, owner: Optional[str], message_docs: List[dict]):
+    """record_message for a batch, in one round trip"""
+    if not owner or not message_docs:
+        return
+    await db["conversations"].bulk_write(
+        [
+            UpdateOne({"owner": owner, "chatId": doc["chatId"]}, _summary_update(doc), upsert=True)
+            for doc in message_docs
+        ],
+        ordered=False,
+    )
+
+
+async def record_status(db, owner: Optional[str], message_doc: dict):
+    """Mirror a status change onto the summary when it concerns the latest message"""
+    if not owner:
+        return
+    await db["conversations"].update_one(
+        {"owner": owner, "chatId": message_doc["chatId"], "lastMessage.id": str(message_doc["_id"])},
+        {"$set": {"lastMessage.status": message_doc.get("status")}},
+    )
+
+
+async def mark_read(db, owner: str, chat_id: str) -> bool:
+    res = await db["conversations"].update_one(
+        {"owner": owner, "chatId": chat_id},
+        {"$set": {"unreadCount": 0}},
+    )
+    return res.matched_count > 0
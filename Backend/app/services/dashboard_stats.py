@@ -0,0 +1,113 @@
+"""
+Per-tenant dashboard counters
+Counts are computed concurrently on a miss and cached for a short TTL; the routes that
+change a tenant's contacts, lists or broadcasts invalidate its entry so the next load is exact.
+Per process, like the other in-memory caches; other workers converge within the TTL.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from bson import ObjectId
+
+from app.core.metrics import register_collector
+from config import settings
+
+
+class DashboardStatsCache:
+    def __init__(self, ttl_seconds: float, max_tenants: int):
+        self._ttl = ttl_seconds
+        self._max_tenants = max_tenants
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Loads overtaken by an invalidation; their results are returned but not cached
+        self._stale: Set[asyncio.Task] = set()
+        self._templates: Optional[Tuple[int, float]] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, loaded_at: float) -> bool:
+        return time.monotonic() - loaded_at < self._ttl
+
+    async def _templates_count(self, db) -> int:
+        # Templates are global (synced from Meta), so one cached count serves every tenant
+        if self._templates is not None and self._fresh(self._templates[1]):
+            return self._templates[0]
+        count = await db["templates"].estimated_document_count()
+        self._templates = (count, time.monotonic())
+        return count
+
+    async def _load(self, db, user_id: str) -> dict:
+        user_oid = ObjectId(user_id)
+        contacts, contact_lists, templates, broadcasts = await asyncio.gather(
+            db["contacts"].count_documents({"user_id": user_oid}),
+            db["contact_lists"].count_documents({"user_id": user_oid}),
+            self._templates_count(db),
+            db["broadcasts"].count_documents({"user_id": user_id}),
+        )
+        return {
+            "contacts": contacts,
+            "contact_lists": contact_lists,
+            "templates": templates,
+            "broadcasts": broadcasts,
+        }
+
+    async def get(self, db, user_id: str) -> dict:
+        entry = self._entries.get(user_id)
+        if entry is not None and self._fresh(entry[1]):
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return dict(entry[0])
+
+        self.misses += 1
+        # Concurrent misses for one tenant share a single load
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.create_task(self._load(db, user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda done: self._finish_load(user_id, done))
+        stats = await asyncio.shield(task)
+        return dict(stats)
+
+    def _finish_load(self, user_id: str, task: asyncio.Task):
+        if self._inflight.get(user_id) is task:
+            del self._inflight[user_id]
+        if task in self._stale:
+            self._stale.discard(task)
+            return
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._entries[user_id] = (task.result(), time.monotonic())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self._max_tenants:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        self._entries.pop(user_id, None)
+        task = self._inflight.pop(user_id, None)
+        if task is not None:
+            self._stale.add(task)
+
+    def invalidate_templates(self):
+        self._templates = None
+        # Cached tenant stats embed the template count
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "tenants": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+# Singleton instance
+dashboard_stats_cache = DashboardStatsCache(
+    ttl_seconds=settings.DASHBOARD_STATS_TTL_SECONDS,
+    max_tenants=settings.DASHBOARD_STATS_MAX_TENANTS,
+)
+register_collector("dashboard_stats", dashboard_stats_cache.stats)
@@ -0,0 +1,69 @@
+"""
+Idempotency-Key support for endpoints that spend money (sends and broadcasts)
+A key is reserved before any side effect; retries with the same key and body replay the stored response.
+"""
+
+import hashlib
+import json
+from typing import Optional
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from app.core.dates import utcnow
+
+COLLECTION = "idempotency_keys"
+
+
+def _key_id(user_id: str, scope: str, key: str) -> str:
+    return f"{user_id}:{scope}:{key}"
+
+
+def _request_hash(payload: dict) -> str:
+    raw = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def claim_key(db, user_id: str, scope: str, key: Optional[str], payload: dict) -> Optional[dict]:
+    """Reserve the key; returns the stored response when this exact request already completed"""
+    if not key:
+        return None
+    doc_id = _key_id(user_id, scope, key)
+    request_hash = _request_hash(payload)
+
+    for _ in range(2):
+        try:
+            await db[COLLECTION].insert_one({
+                "_id": doc_id,
+                "request_hash": request_hash,
+                "status": "in_progress",
+                "createdAt": utcnow(),
+            })
+            return None
+        except DuplicateKeyError:
+            existing = await db[COLLECTION].find_one({"_id": doc_id})
+            if existing is None:
+                # Expired between the insert and the read; try to reserve again
+                continue
+            if existing["request_hash"] != request_hash:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+            if existing["status"] == "done":
+                return existing["response"]
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    raise HTTPException(status_code=409, detail="Could not reserve Idempotency-Key")
+
+
+async def complete_key(db, user_id: str, scope: str, key: Optional[str], response: dict):
+    if not key:
+        return
+    await db[COLLECTION].update_one(
+        {"_id": _key_id(user_id, scope, key)},
+        {"$set": {"status": "done", "response": response}},
+    )
+
+
+async def release_key(db, user_id: str, scope: str, key: Optional[str]):
+    """Drop a reservation after a failure that had no side effects, so the client may retry"""
+    if not key:
+        return
+    await db[COLLECTION].delete_one({"_id": _key_id(user_id, scope, key)})
@@ -0,0 +1,38 @@
+"""
+Named leases for periodic jobs
+Every worker runs the background loops; a lease document in `leases` lets one of them do a
+pass at a time. Holders renew while working, and a crashed holder's lease simply expires.
+"""
+
+import os
+import socket
+from datetime import timedelta
+from uuid import uuid4
+
+from pymongo.errors import DuplicateKeyError
+
+from app.core.dates import utcnow
+
+COLLECTION = "leases"
+
+# Identifies this process as a lease holder
+HOLDER = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+
+async def acquire_lease(db, name: str, seconds: float) -> bool:
+    """Take or renew the lease; False while another live holder has it"""
+    now = utcnow()
+    try:
+        await db[COLLECTION].update_one(
+            {"_id": name, "$or": [{"until": {"$lt": now}}, {"holder": HOLDER}]},
+            {"$set": {"holder": HOLDER, "until": now + timedelta(seconds=seconds)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The filter missed because someone else holds it, so the upsert hit the existing _id
+        return False
+    return True
+
+
+async def release_lease(db, name: str):
+    await db[COLLECTION].update_one({"_id": name, "holder": HOLDER}, {"$set": {"until": utcnow()}})
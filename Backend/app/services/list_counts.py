@@ -0,0 +1,116 @@
+"""
+Denormalized contact_count on contact_lists
+Contact writes adjust the counters with $inc as memberships change; a periodic pass, run by
+one worker under a lease, recounts each list to repair any drift (crashes between writes,
+manual edits). Lists that predate the counter are backfilled by a migration.
+"""
+
+import asyncio
+import logging
+from typing import Iterable
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.services.leases import acquire_lease, release_lease
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+LIST_COUNT_LEASE = "list_counts"
+LIST_COUNT_LEASE_SECONDS = 600
+LEASE_RENEW_EVERY = 100
+# migration_state id of the one-off recount (app/db/migrations.py backfill_list_counts)
+BACKFILL_STATE_ID = "backfill_list_counts"
+
+_backfilled = False
+
+
+async def list_counts_ready(db) -> bool:
+    """Whether contact_count can be trusted, i.e. the backfill has finished"""
+    global _backfilled
+    if not _backfilled:
+        state = await db["migration_state"].find_one({"_id": BACKFILL_STATE_ID}, {"done": 1})
+        _backfilled = bool(state and state.get("done"))
+    return _backfilled
+
+
+async def adjust_list_counts(db, user_oid: ObjectId, added: Iterable[ObjectId] = (), removed: Iterable[ObjectId] = ()):
+    """Apply membership changes for one contact (or a batch, by repeating ids)"""
+    deltas = {}
+    for lid in added:
+        deltas[lid] = deltas.get(lid, 0) + 1
+    for lid in removed:
+        deltas[lid] = deltas.get(lid, 0) - 1
+    ops = [
+        # Scoped to the owner so ids of other users' lists are ignored
+        UpdateOne({"_id": lid, "user_id": user_oid}, {"$inc": {"contact_count": delta}})
+        for lid, delta in deltas.items() if delta
+    ]
+    if ops:
+        await db["contact_lists"].bulk_write(ops, ordered=False)
+
+
+async def increment_list_count(db, user_oid: ObjectId, list_oid: ObjectId, delta: int) -> int:
+    """Apply a bulk membership change to one list; returns the new count"""
+    doc = await db["contact_lists"].find_one_and_update(
+        {"_id": list_oid, "user_id": user_oid},
+        {"$inc": {"contact_count": delta}},
+        projection={"contact_count": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc.get("contact_count", 0) if doc else 0
+
+
+async def refresh_list_count(db, user_oid: ObjectId, list_oid: ObjectId) -> int:
+    """Recount one list exactly, e.g. after a bulk operation whose per-contact changes aren't known"""
+    count = await db["contacts"].count_documents({"user_id": user_oid, "list_ids": list_oid})
+    await db["contact_lists"].update_one({"_id": list_oid, "user_id": user_oid}, {"$set": {"contact_count": count}})
+    return count
+
+
+async def reconcile_list_count(db, lst: dict) -> bool:
+    """
+    Recount one list and store the result only if contact_count hasn't moved meanwhile, so an $inc
+    landing during the count is never overwritten (that list is simply retried next pass).
+    Returns whether the count was corrected.
+    """
+    count = await db["contacts"].count_documents({"user_id": lst["user_id"], "list_ids": lst["_id"]})
+    if lst.get("contact_count") == count:
+        return False
+    res = await db["contact_lists"].update_one(
+        {"_id": lst["_id"], "contact_count": lst.get("contact_count")},
+        {"$set": {"contact_count": count}},
+    )
+    return res.modified_count > 0
+
+
+async def reconcile_list_counts(db) -> int:
+    """Recount every list one at a time on the (user_id, list_ids) index; returns the number corrected"""
+    fixed = seen = 0
+    async for lst in db["contact_lists"].find({}, {"user_id": 1, "contact_count": 1}).sort("_id", 1):
+        seen += 1
+        if seen % LEASE_RENEW_EVERY == 0 and not await acquire_lease(db, LIST_COUNT_LEASE, LIST_COUNT_LEASE_SECONDS):
+            logger.warning("List count lease lost; stopping this pass")
+            break
+        if await reconcile_list_count(db, lst):
+            fixed += 1
+    return fixed
+
+
+async def list_count_loop(db):
+    # Lists predating contact_count are backfilled by a migration; this only repairs drift
+    while True:
+        await asyncio.sleep(settings.LIST_COUNT_RECONCILE_INTERVAL_SECONDS)
+        try:
+            # One worker per pass
+            if await acquire_lease(db, LIST_COUNT_LEASE, LIST_COUNT_LEASE_SECONDS):
+                try:
+                    fixed = await reconcile_list_counts(db)
+                finally:
+                    await release_lease(db, LIST_COUNT_LEASE)
+                if fixed:
+                    logger.info(f"Reconciled contact_count on {fixed} lists")
+        except PyMongoError as exc:
+            logger.error(f"List count reconciliation failed: {exc}", exc_info=True)
@@ -0,0 +1,107 @@
+"""
+Hot window cache
+Keeps the last N messages of recently viewed chats in memory so the first page of
+GET /messages skips the database. Per process; entries expire after a short TTL to
+bound staleness from writes handled by other workers.
+"""
+
+import time
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional, Tuple
+
+from app.core.metrics import register_collector
+from config import settings
+
+ChatKey = Tuple[str, str]
+
+
+class _Window:
+    __slots__ = ("messages", "loaded_at", "complete")
+
+    def __init__(self, messages: Deque[dict], complete: bool):
+        self.messages = messages
+        self.loaded_at = time.monotonic()
+        # The ring holds every hot message of the chat, so a short window is still a full answer
+        self.complete = complete
+
+
+class MessageWindowCache:
+    """Bounded per-chat ring of recent messages, LRU-evicted by chat"""
+
+    def __init__(self, window: int, max_chats: int, ttl_seconds: float):
+        self.window = window
+        self._max_chats = max_chats
+        self._ttl = ttl_seconds
+        self._chats: "OrderedDict[ChatKey, _Window]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key: ChatKey) -> Optional[_Window]:
+        entry = self._chats.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.loaded_at > self._ttl:
+            del self._chats[key]
+            return None
+        self._chats.move_to_end(key)
+        return entry
+
+    def first_page(self, owner: str, chat_id: str, limit: int) -> Optional[List[dict]]:
+        """Newest-first copy of the latest `limit` messages, or None on a miss"""
+        entry = self._get((owner, chat_id))
+        if entry is None or (len(entry.messages) < limit and not entry.complete):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [dict(m) for m in list(entry.messages)[-limit:]][::-1]
+
+    def seed(self, owner: str, chat_id: str, newest_first: List[dict]):
+        """Install a window loaded from the database (newest first, as queried with limit=window)"""
+        ring: Deque[dict] = deque(maxlen=self.window)
+        ring.extend(dict(m) for m in reversed(newest_first))
+        self._chats[(owner, chat_id)] = _Window(ring, complete=len(newest_first) < self.window)
+        self._chats.move_to_end((owner, chat_id))
+        while len(self._chats) > self._max_chats:
+            self._chats.popitem(last=False)
+
+    def append(self, owner: Optional[str], message_doc: dict):
+        """Write-through for a newly inserted message; chats not in cache are left to load on demand"""
+        if not owner:
+            return
+        entry = self._chats.get((owner, message_doc.get("chatId")))
+        if entry is not None:
+            if len(entry.messages) == self.window:
+                # The oldest message falls out of the ring
+                entry.complete = False
+            entry.messages.append(dict(message_doc))
+
+    def update_status(self, owner: Optional[str], message_doc: dict):
+        if not owner:
+            return
+        entry = self._chats.get((owner, message_doc.get("chatId")))
+        if entry is None:
+            return
+        for msg in entry.messages:
+            if msg["_id"] == message_doc["_id"]:
+                msg["status"] = message_doc.get("status")
+                msg["updatedAt"] = message_doc.get("updatedAt")
+                msg["whatsappMessageId"] = message_doc.get("whatsappMessageId")
+                break
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "chats": len(self._chats),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+# Singleton instance
+message_cache = MessageWindowCache(
+    window=settings.MESSAGE_CACHE_WINDOW,
+    max_chats=settings.MESSAGE_CACHE_MAX_CHATS,
+    ttl_seconds=settings.MESSAGE_CACHE_TTL_SECONDS,
+)
+register_collector("message_cache", message_cache.stats)
@@ -0,0 +1,290 @@
+"""
+Outbox for outgoing WhatsApp messages
+Requests write the message document (status "sending") plus an outbox job and return at once;
+the dispatcher delivers jobs to the Graph API and publishes the outcome through the socket layer.
+Broadcast jobs are claimed after interactive ones, so a large broadcast doesn't hold up single sends.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+import httpx
+from bson import ObjectId
+from fastapi import HTTPException
+from pydantic import ValidationError
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+
+from app.core.dates import utcnow
+from app.services.broadcasts import record_recipient_result
+from app.services.conversations import record_message, record_messages, record_status
+from app.services.message_cache import message_cache
+from app.services.rate_limit import whatsapp_send_limiter
+from app.services.templates import build_template_payload
+from app.sockets import emit_to_user, status_buffer
+from config import settings
+from models import TemplateRequest
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "outbox"
+LEASE_SECONDS = 60
+
+# Claim order: lower first
+INTERACTIVE_PRIORITY = 0
+BULK_PRIORITY = 1
+
+
+def _job(owner: str, message_doc: dict, kind: str, payload: dict, priority: int) -> dict:
+    message_doc.setdefault("_id", ObjectId())
+    now = utcnow()
+    return {
+        "kind": kind,
+        "owner": owner,
+        "message_id": message_doc["_id"],
+        "message": message_doc,
+        "payload": payload,
+        "priority": priority,
+        "status": "pending",
+        "attempts": 0,
+        "available_at": now,
+        "created_at": now,
+    }
+
+
+async def enqueue_message(db, owner: str, message_doc: dict, kind: str, payload: dict) -> dict:
+    """Persist a pending message and its delivery job; returns the stored message document"""
+    # The job goes first and carries the message: if the request dies before the message insert,
+    # the dispatcher still creates it (_ensure_message), so no message is left "sending" without a job
+    await db[COLLECTION].insert_one(_job(owner, message_doc, kind, payload, INTERACTIVE_PRIORITY))
+    try:
+        await db["messages"].insert_one(message_doc)
+    except DuplicateKeyError:
+        # A dispatcher already created it from the job
+        pass
+    await record_message(db, owner, message_doc)
+    message_cache.append(owner, message_doc)
+    outbox_dispatcher.wake()
+    return message_doc
+
+
+async def enqueue_broadcast_messages(
+    db, owner: str, broadcast_id: str, first_index: int, messages: List[Tuple[dict, str, dict]]
+) -> int:
+    """
+    Queue a batch of broadcast recipients, given as (message_doc, kind, payload) starting at
+    recipient first_index. Jobs are inserted in order, so on a BulkWriteError the first
+    details["nInserted"] recipients are queued and the rest are not.
+    """
+    jobs = []
+    for offset, (message_doc, kind, payload) in enumerate(messages):
+        job = _job(owner, message_doc, kind, payload, BULK_PRIORITY)
+        job["broadcast"] = {"id": broadcast_id, "index": first_index + offset}
+        jobs.append(job)
+    await db[COLLECTION].insert_many(jobs, ordered=True)
+    outbox_dispatcher.wake()
+
+    # The jobs are stored, so these writes no longer decide the outcome: a message that didn't make
+    # it is created from its job by _ensure_message
+    message_docs = [message_doc for message_doc, _, _ in messages]
+    try:
+        try:
+            await db["messages"].insert_many(message_docs, ordered=False)
+        except BulkWriteError as exc:
+            # Duplicates were already created from their jobs
+            if any(error.get("code") != 11000 for error in exc.details.get("writeErrors", [])):
+                raise
+        # Outgoing messages leave unread alone, so recording one twice is harmless
+        await record_messages(db, owner, message_docs)
+    except PyMongoError as exc:
+        logger.warning(f"Broadcast {broadcast_id} messages left to the dispatcher: {exc}")
+    for message_doc in message_docs:
+        message_cache.append(owner, message_doc)
+    return len(jobs)
+
+
+class OutboxDispatcher:
+    """Background consumers that claim outbox jobs with a lease, so any worker can pick up any job"""
+
+    def __init__(self):
+        self._db = None
+        self._tasks: List[asyncio.Task] = []
+        self._wake = asyncio.Event()
+
+    def start(self, db):
+        self._db = db
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(settings.OUTBOX_CONCURRENCY)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def wake(self):
+        self._wake.set()
+
+    async def _claim(self) -> Optional[dict]:
+        now = utcnow()
+        return await self._db[COLLECTION].find_one_and_update(
+            {
+                "$or": [
+                    {"status": "pending", "available_at": {"$lte": now}},
+                    # A worker died mid-delivery
+                    {"status": "processing", "lease_until": {"$lt": now}},
+                ]
+            },
+            {
+                "$set": {"status": "processing", "lease_until": now + timedelta(seconds=LEASE_SECONDS)},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", 1), ("available_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _run(self):
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            while True:
+                try:
+                    job = await self._claim()
+                except Exception as exc:
+                    logger.error(f"Outbox claim failed: {exc}", exc_info=True)
+                    job = None
+                if job is None:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=settings.OUTBOX_POLL_INTERVAL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wake.clear()
+                    continue
+                try:
+                    await self._process(job, client)
+                except PyMongoError as exc:
+                    # The lease expires and another attempt picks the job up
+                    logger.error(f"Outbox job {job['_id']} bookkeeping failed: {exc}")
+                except Exception as exc:
+                    # Never let one job end the worker; the lease (and attempts) bound any repeat
+                    logger.error(f"Outbox job {job['_id']} could not be settled: {exc}", exc_info=True)
+
+    async def _ensure_message(self, job: dict):
+        message_doc = job.get("message")
+        if message_doc is None:
+            return
+        fields = {k: v for k, v in message_doc.items() if k != "_id"}
+        res = await self._db["messages"].update_one({"_id": message_doc["_id"]}, {"$setOnInsert": fields}, upsert=True)
+        if res.upserted_id is not None:
+            # The enqueuing request died between the job and message inserts
+            await record_message(self._db, job["owner"], message_doc)
+
+    async def _process(self, job: dict, client: httpx.AsyncClient):
+        await self._ensure_message(job)
+        if job["attempts"] > settings.OUTBOX_MAX_ATTEMPTS:
+            # Its lease kept expiring mid-delivery (the worker died each time)
+            await self._finish(job, "failed", None, {"message": "Delivery attempts exhausted"})
+            return
+        try:
+            await self._deliver(job, client)
+        except PyMongoError:
+            raise
+        except (ValidationError, KeyError, TypeError) as exc:
+            # The stored payload can't be sent; retrying won't change that
+            logger.error(f"Outbox job {job['_id']} has an invalid payload: {exc}", exc_info=True)
+            await self._finish(job, "failed", None, {"message": "Invalid message payload"})
+        except Exception as exc:
+            logger.error(f"Outbox job {job['_id']} failed: {exc}", exc_info=True)
+            await self._retry_or_fail(job, {"message": str(exc)})
+
+    async def _deliver(self, job: dict, client: httpx.AsyncClient):
+        url = f"https://graph.facebook.com/{settings.WHATSAPP_API_VERSION}/{settings.WHATSAPP_PHONE_NUMBER_ID}/messages"
+        headers = {
+            "Authorization": f"Bearer {settings.WHATSAPP_ACCESS_TOKEN}",
+            "Content-Type": "application/json",
+        }
+        try:
+            if job["kind"] == "template":
+                payload = await build_template_payload(TemplateRequest(**job["payload"]), client)
+            else:
+                payload = job["payload"]
+            await whatsapp_send_limiter.acquire()
+            response = await client.post(url, json=payload, headers=headers)
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code >= 500 or e.response.status_code == 429:
+                await self._retry_or_fail(job, {"status_code": e.response.status_code, "body": e.response.text})
+            else:
+                try:
+                    details = e.response.json()
+                except ValueError:
+                    details = {"message": e.response.text}
+                await self._finish(job, "failed", None, details)
+            return
+        except httpx.RequestError as e:
+            await self._retry_or_fail(job, {"message": str(e)})
+            return
+        except HTTPException as e:
+            await self._finish(job, "failed", None, {"message": e.detail})
+            return
+
+        # Delivered at this point; an unreadable body must not lead to a resend
+        try:
+            messages = response.json().get("messages") or [{}]
+        except (ValueError, AttributeError):
+            logger.warning(f"Outbox job {job['_id']} sent but the response had no message id")
+            messages = [{}]
+        await self._finish(job, "sent", messages[0].get("id"), None)
+
+    async def _retry_or_fail(self, job: dict, details: dict):
+        if job["attempts"] >= settings.OUTBOX_MAX_ATTEMPTS:
+            await self._finish(job, "failed", None, details)
+            return
+        backoff = min(2 ** job["attempts"], 300)
+        await self._db[COLLECTION].update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "pending", "available_at": utcnow() + timedelta(seconds=backoff), "last_error": details}},
+        )
+
+    async def _finish(self, job: dict, status: str, whatsapp_message_id: Optional[str], details: Optional[dict]):
+        updates = {"status": status, "updatedAt": utcnow()}
+        if whatsapp_message_id:
+            updates["whatsappMessageId"] = whatsapp_message_id
+        if details:
+            updates["error"] = details
+        # Only move forward from "sending", so a re-delivered job never overwrites a later status
+        doc = await self._db["messages"].find_one_and_update(
+            {"_id": job["message_id"], "status": "sending"},
+            {"$set": updates},
+            return_document=ReturnDocument.AFTER,
+        )
+        await self._db[COLLECTION].delete_one({"_id": job["_id"]})
+        if job.get("broadcast"):
+            # Even when a webhook already moved the message on; the recipient slot guards repeats
+            await record_recipient_result(self._db, job["broadcast"], status, whatsapp_message_id, details)
+        if doc is None:
+            return
+
+        owner = job["owner"]
+        await record_status(self._db, owner, doc)
+        message_cache.update_status(owner, doc)
+        status_buffer.add(owner, {
+            "messageId": str(doc["_id"]),
+            "whatsappMessageId": whatsapp_message_id,
+            "status": status,
+            "timestamp": str(int(time.time())),
+        })
+        if status == "failed":
+            try:
+                await emit_to_user("message_failed", {"messageId": str(doc["_id"]), "details": details}, owner)
+            except Exception as exc:
+                # The outcome is stored; a missed live notification is not worth a retry
+                logger.warning(f"message_failed emit for {doc['_id']} failed: {exc}")
+
+
+# Singleton instance
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,103 @@
+"""
+Verified principal cache
+get_current_user resolves a bearer token to a user with a JWT decode and a users lookup; this
+keeps the result per token hash for a short TTL (never past the token's own expiry), so most
+requests skip both. Per process: invalidation is explicit locally and TTL-bounded elsewhere.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from app.core.metrics import register_collector
+from config import settings
+from models import UserPublic
+
+
+def token_key(raw_token: str) -> str:
+    # Never keep raw tokens in memory longer than the request
+    return hashlib.sha256(raw_token.encode()).hexdigest()
+
+
+class PrincipalCache:
+    """Bounded LRU of token hash -> UserPublic with a user id index for invalidation"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[UserPublic, float]]" = OrderedDict()
+        self._by_user: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._ttl > 0 and self._max_entries > 0
+
+    def get(self, raw_token: str) -> Optional[UserPublic]:
+        if not self.enabled:
+            return None
+        key = token_key(raw_token)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, raw_token: str, user: UserPublic, token_expires_at: Optional[float] = None):
+        if not self.enabled:
+            return
+        expires_at = time.time() + self._ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        key = token_key(raw_token)
+        self._entries[key] = (user, expires_at)
+        self._entries.move_to_end(key)
+        self._by_user.setdefault(user.id, set()).add(key)
+        while len(self._entries) > self._max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_user.get(entry[0].id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[entry[0].id]
+
+    def invalidate_token(self, raw_token: str):
+        """Logout: forget the principal for this token"""
+        self._drop(token_key(raw_token))
+
+    def invalidate_user(self, user_id: str):
+        """Account deletion or profile change: forget every cached token of the user"""
+        for key in list(self._by_user.get(user_id, ())):
+            self._drop(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_user.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+# Singleton instance
+principal_cache = PrincipalCache(
+    max_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.AUTH_CACHE_TTL_SECONDS,
+)
+register_collector("principal_cache", principal_cache.stats)
@@ -0,0 +1,53 @@
+"""
+Outbound send throttle
+One token bucket per process shared by every path that posts messages to the Graph API
+(outbox, broadcasts, bulk template sends), so concurrent senders cannot exceed the number's throughput.
+"""
+
+import asyncio
+import time
+
+from app.core.metrics import register_collector
+from config import settings
+
+
+class TokenBucket:
+    """FIFO token bucket: waiters are served in arrival order at `rate` per second, bursting up to `burst`"""
+
+    def __init__(self, rate: float, burst: int):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.acquired = 0
+        self.waited_seconds = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def acquire(self):
+        started = time.monotonic()
+        # Holding the lock while sleeping keeps callers in order
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+                self._refill()
+            self._tokens -= 1
+        self.acquired += 1
+        self.waited_seconds += time.monotonic() - started
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_second": self._rate,
+            "acquired": self.acquired,
+            "waited_seconds": round(self.waited_seconds, 3),
+        }
+
+
+# Singleton instance
+whatsapp_send_limiter = TokenBucket(rate=settings.WHATSAPP_SEND_RATE_PER_SECOND, burst=settings.WHATSAPP_SEND_BURST)
+register_collector("whatsapp_send_limiter", whatsapp_send_limiter.stats)
@@ -0,0 +1,197 @@
+"""
+Hot/cold message tiering
+Messages older than a tenant's hot window move to messages_archive, packed as one
+zlib-compressed BSON bucket per (owner, chatId, day)
+"""
+
+import asyncio
+import logging
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import bson
+from bson import Binary, ObjectId
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from app.core.dates import utcnow
+from app.services.leases import acquire_lease, release_lease
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLLECTION = "messages_archive"
+BUCKET_WRITE_ATTEMPTS = 5
+DUPLICATE_KEY = 11000
+# One worker archives at a time; renewed per tenant, so it only has to outlast one tenant's pass
+RETENTION_LEASE = "retention"
+RETENTION_LEASE_SECONDS = 600
+
+
+def _day(value: datetime) -> datetime:
+    return datetime(value.year, value.month, value.day)
+
+
+def _bucket_id(owner: str, chat_id: str, day: datetime) -> str:
+    return f"{owner}:{chat_id}:{day.date().isoformat()}"
+
+
+def pack_messages(messages: List[dict]) -> Binary:
+    return Binary(zlib.compress(bson.encode({"m": messages})))
+
+
+def unpack_messages(bucket: dict) -> List[dict]:
+    return bson.decode(zlib.decompress(bucket["data"]))["m"]
+
+
+def _sort_key(msg: dict):
+    return (msg["createdAt"], msg["_id"])
+
+
+def _version_filter(bucket_id: str, bucket: Optional[dict]) -> dict:
+    # Buckets written before versioning carry no version field
+    if bucket is None or "version" not in bucket:
+        return {"_id": bucket_id, "version": {"$exists": False}}
+    return {"_id": bucket_id, "version": bucket["version"]}
+
+
+async def _write_buckets(db, owner: str, grouped: Dict[Tuple[str, datetime], List[dict]]):
+    """
+    Merge messages into their day buckets with compare-and-swap on a version field: a bucket
+    changed since it was read fails its filter, the upsert then collides on _id, and only the
+    colliding buckets are re-read and merged again. Nothing is overwritten unseen.
+    """
+    pending = dict(grouped)
+    for attempt in range(BUCKET_WRITE_ATTEMPTS):
+        keys = list(pending)
+        ids = [_bucket_id(owner, chat_id, day) for chat_id, day in keys]
+        existing = {b["_id"]: b async for b in db[ARCHIVE_COLLECTION].find({"_id": {"$in": ids}})}
+
+        ops = []
+        for (chat_id, day), bucket_id in zip(keys, ids):
+            bucket = existing.get(bucket_id)
+            # Keyed by _id so a re-run after a crash is harmless
+            merged = {m["_id"]: m for m in unpack_messages(bucket)} if bucket else {}
+            merged.update((m["_id"], m) for m in pending[(chat_id, day)])
+            ordered = sorted(merged.values(), key=_sort_key)
+            ops.append(ReplaceOne(
+                _version_filter(bucket_id, bucket),
+                {
+                    "_id": bucket_id,
+                    "owner": owner,
+                    "chatId": chat_id,
+                    "day": day,
+                    "count": len(ordered),
+                    "minCreatedAt": ordered[0]["createdAt"],
+                    "maxCreatedAt": ordered[-1]["createdAt"],
+                    "data": pack_messages(ordered),
+                    "archivedAt": utcnow(),
+                    "version": (bucket or {}).get("version", 0) + 1,
+                },
+                upsert=True,
+            ))
+        if not ops:
+            return
+        try:
+            await db[ARCHIVE_COLLECTION].bulk_write(ops, ordered=False)
+            return
+        except BulkWriteError as exc:
+            errors = exc.details.get("writeErrors", [])
+            if attempt == BUCKET_WRITE_ATTEMPTS - 1 or any(e.get("code") != DUPLICATE_KEY for e in errors):
+                raise
+            # The other buckets were written; retry only those another writer changed
+            pending = {keys[e["index"]]: pending[keys[e["index"]]] for e in errors}
+
+
+async def archive_owner(db, owner: str, cutoff: datetime, batch_size: Optional[int] = None) -> int:
+    """Move one tenant's messages older than cutoff into the archive; returns the number moved"""
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    moved = 0
+    while True:
+        batch = await (
+            db["messages"]
+            .find({"owner": owner, "createdAt": {"$lt": cutoff}})
+            .sort([("createdAt", 1), ("_id", 1)])
+            .limit(batch_size)
+            .to_list(length=batch_size)
+        )
+        if not batch:
+            return moved
+
+        grouped: Dict[Tuple[str, datetime], List[dict]] = defaultdict(list)
+        for msg in batch:
+            grouped[(msg.get("chatId"), _day(msg["createdAt"]))].append(msg)
+
+        # Archive first, then delete: a crash in between only leaves duplicates the next run merges away,
+        # and a failed bucket write raises before any hot copy is removed
+        await _write_buckets(db, owner, grouped)
+        await db["messages"].delete_many({"_id": {"$in": [m["_id"] for m in batch]}})
+        moved += len(batch)
+
+
+async def run_retention(db):
+    """One archival pass over every tenant, honouring per-user message_retention_days"""
+    now = utcnow()
+    projection = {"message_retention_days": 1}
+    async for user in db["users"].find({}, projection):
+        if not await acquire_lease(db, RETENTION_LEASE, RETENTION_LEASE_SECONDS):
+            logger.warning("Retention lease lost; stopping this pass")
+            return
+        days = user.get("message_retention_days") or settings.MESSAGE_HOT_RETENTION_DAYS
+        moved = await archive_owner(db, str(user["_id"]), now - timedelta(days=days))
+        if moved:
+            logger.info(f"Archived {moved} messages for user {user['_id']}")
+
+
+async def retention_loop(db):
+    while True:
+        try:
+            if await acquire_lease(db, RETENTION_LEASE, RETENTION_LEASE_SECONDS):
+                try:
+                    await run_retention(db)
+                finally:
+                    await release_lease(db, RETENTION_LEASE)
+        except PyMongoError as exc:
+            logger.error(f"Retention pass failed: {exc}", exc_info=True)
+        await asyncio.sleep(settings.RETENTION_INTERVAL_SECONDS)
+
+
+async def load_archived(
+    db,
+    owner: str,
+    chat_id: Optional[str],
+    older_than: Optional[Tuple[datetime, ObjectId]],
+    limit: int,
+) -> List[dict]:
+    """Newest-first archived messages strictly older than older_than, used when paging past the hot window"""
+    query = {"owner": owner}
+    if chat_id:
+        query["chatId"] = chat_id
+    if older_than and isinstance(older_than[0], datetime):
+        query["day"] = {"$lte": _day(older_than[0])}
+
+    results: List[dict] = []
+    day_group: List[dict] = []
+    current_day = None
+
+    def take(group: List[dict]):
+        for msg in sorted(group, key=_sort_key, reverse=True):
+            if older_than and isinstance(older_than[0], datetime) and _sort_key(msg) >= older_than:
+                continue
+            results.append(msg)
+            if len(results) >= limit:
+                return
+
+    # Buckets of one day (several chats when chat_id is None) must be merged before ordering
+    async for bucket in db[ARCHIVE_COLLECTION].find(query).sort("day", -1):
+        if current_day is not None and bucket["day"] != current_day:
+            take(day_group)
+            if len(results) >= limit:
+                return results
+            day_group = []
+        current_day = bucket["day"]
+        day_group.extend(unpack_messages(bucket))
+    take(day_group)
+    return results[:limit]
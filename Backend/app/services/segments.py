@@ -0,0 +1,201 @@
+"""
+Saved contact segments
+A segment is a boolean rule tree over contact fields. It compiles to a plain Mongo query rooted at
+{"user_id": ...} so the (user_id, ...) contact indexes drive every evaluation; counts for previews
+are answered from contact_count when the rule is a single list, otherwise counted and cached briefly.
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Set, Tuple, Union
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.core.dates import parse_iso, to_naive_utc, utcnow
+from app.core.responses import dumps
+from app.services.list_counts import list_counts_ready
+from models import SegmentCondition, SegmentRule
+
+MAX_DEPTH = 5
+MAX_CONDITIONS = 50
+PREVIEW_TTL_SECONDS = 30
+PREVIEW_MAX_ENTRIES = 2000
+COUNT_MAX_TIME_MS = 5000
+
+ATTRIBUTE_OPS = {"eq", "ne", "in", "exists", "not_exists"}
+DATE_OPS = {"after", "before", "within_days", "not_within_days"}
+
+
+def _bad(detail: str):
+    raise HTTPException(status_code=400, detail=f"Invalid segment: {detail}")
+
+
+def _oids(value) -> List[ObjectId]:
+    if not isinstance(value, list) or not value:
+        _bad("list conditions take a non-empty array of list ids")
+    try:
+        return [ObjectId(v) for v in value]
+    except Exception:
+        _bad("invalid list id")
+
+
+def _days(value) -> int:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        _bad("within_days takes a positive number of days")
+    return value
+
+
+def _date(value) -> datetime:
+    parsed = parse_iso(value) if isinstance(value, str) else value
+    if not isinstance(parsed, datetime):
+        _bad("after/before take an ISO datetime")
+    return to_naive_utc(parsed)
+
+
+def _compile_condition(cond: SegmentCondition, now: datetime, list_ids: Set[ObjectId]) -> dict:
+    if cond.field == "list":
+        if cond.op not in ("in", "not_in"):
+            _bad("list conditions support in / not_in")
+        oids = _oids(cond.value)
+        list_ids.update(oids)
+        return {"list_ids": {"$in" if cond.op == "in" else "$nin": oids}}
+
+    if cond.field in ("created_at", "last_inbound_at"):
+        if cond.op not in DATE_OPS or (cond.field == "last_inbound_at" and cond.op in ("after", "before")):
+            _bad(f"unsupported operator {cond.op} for {cond.field}")
+        if cond.op == "after":
+            return {cond.field: {"$gte": _date(cond.value)}}
+        if cond.op == "before":
+            return {cond.field: {"$lt": _date(cond.value)}}
+        since = now - timedelta(days=_days(cond.value))
+        if cond.op == "within_days":
+            return {cond.field: {"$gte": since}}
+        # Both branches are plain range/equality tests, unlike $not, so each can use an index
+        return {"$or": [{cond.field: {"$lt": since}}, {cond.field: None}]}
+
+    if cond.op not in ATTRIBUTE_OPS:
+        _bad(f"unsupported operator {cond.op} for attributes")
+    if not cond.key or cond.key.startswith("$") or "." in cond.key:
+        _bad("attribute conditions need a plain key")
+    path = f"attributes.{cond.key}"
+    if cond.op == "exists":
+        return {path: {"$exists": True}}
+    if cond.op == "not_exists":
+        return {path: {"$exists": False}}
+    if cond.op == "in":
+        if not isinstance(cond.value, list):
+            _bad("attribute in takes an array")
+        return {path: {"$in": cond.value}}
+    return {path: cond.value if cond.op == "eq" else {"$ne": cond.value}}
+
+
+def _compile_rule(rule: Union[SegmentRule, SegmentCondition], now: datetime, list_ids: Set[ObjectId], depth: int, counter: List[int]) -> dict:
+    if isinstance(rule, SegmentCondition):
+        counter[0] += 1
+        if counter[0] > MAX_CONDITIONS:
+            _bad(f"at most {MAX_CONDITIONS} conditions")
+        return _compile_condition(rule, now, list_ids)
+
+    if depth > MAX_DEPTH:
+        _bad(f"nesting deeper than {MAX_DEPTH}")
+    if not rule.rules:
+        _bad(f"'{rule.op}' needs at least one rule")
+    parts = [_compile_rule(r, now, list_ids, depth + 1, counter) for r in rule.rules]
+    if rule.op == "or":
+        return parts[0] if len(parts) == 1 else {"$or": parts}
+    if rule.op == "not":
+        return {"$nor": [parts[0] if len(parts) == 1 else {"$and": parts}]}
+    return parts[0] if len(parts) == 1 else {"$and": parts}
+
+
+def compile_segment(user_oid: ObjectId, rule: SegmentRule, now: datetime = None) -> Tuple[dict, Set[ObjectId]]:
+    """(query, referenced list ids); the query always leads with user_id"""
+    list_ids: Set[ObjectId] = set()
+    body = _compile_rule(rule, now or utcnow(), list_ids, 1, [0])
+    return {"$and": [{"user_id": user_oid}, body]}, list_ids
+
+
+async def validate_segment(db, user_oid: ObjectId, rule: SegmentRule) -> dict:
+    """Compile and check that every referenced list belongs to the user; returns the query"""
+    query, list_ids = compile_segment(user_oid, rule)
+    if list_ids:
+        owned = await db["contact_lists"].count_documents({"_id": {"$in": list(list_ids)}, "user_id": user_oid})
+        if owned != len(list_ids):
+            raise HTTPException(status_code=404, detail="List not found")
+    return query
+
+
+def _single_list(rule: SegmentRule):
+    # {"op": "and"|"or", "rules": [{"field": "list", "op": "in", "value": [one id]}]}
+    if rule.op == "not" or len(rule.rules) != 1:
+        return None
+    cond = rule.rules[0]
+    if isinstance(cond, SegmentCondition) and cond.field == "list" and cond.op == "in" and isinstance(cond.value, list) and len(cond.value) == 1:
+        return ObjectId(cond.value[0])
+    return None
+
+
+class SegmentCountCache:
+    """Short-lived counts keyed by (user, compiled query), so previews while editing stay cheap"""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self._ttl = ttl_seconds
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+    @staticmethod
+    def key(user_oid: ObjectId, query: dict) -> str:
+        return f"{user_oid}:{hashlib.sha256(dumps(query)).hexdigest()}"
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[1] > self._ttl:
+            return None
+        return entry[0]
+
+    def put(self, key: str, count: int):
+        self._entries[key] = (count, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+
+# Singleton instance
+segment_counts = SegmentCountCache(PREVIEW_TTL_SECONDS, PREVIEW_MAX_ENTRIES)
+
+
+async def count_segment(db, user_oid: ObjectId, rule: SegmentRule) -> dict:
+    query = await validate_segment(db, user_oid, rule)
+
+    list_oid = _single_list(rule)
+    if list_oid is not None and await list_counts_ready(db):
+        lst = await db["contact_lists"].find_one({"_id": list_oid, "user_id": user_oid}, {"contact_count": 1})
+        if lst is not None and "contact_count" in lst:
+            return {"count": lst["contact_count"], "source": "list_count"}
+
+    # Relative ranges ("within 30 days") shift slowly; a few seconds of reuse is harmless
+    key = SegmentCountCache.key(user_oid, compile_segment(user_oid, rule, now=utcnow().replace(second=0, microsecond=0))[0])
+    cached = segment_counts.get(key)
+    if cached is not None:
+        return {"count": cached, "source": "cache"}
+    count = await db["contacts"].count_documents(query, maxTimeMS=COUNT_MAX_TIME_MS)
+    segment_counts.put(key, count)
+    return {"count": count, "source": "query"}
+
+
+async def load_segment_rule(db, user_oid: ObjectId, segment_oid: ObjectId) -> SegmentRule:
+    doc = await db["segments"].find_one({"_id": segment_oid, "user_id": user_oid}, {"rule": 1})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Segment not found")
+    return SegmentRule.model_validate(doc["rule"])
+
+
+async def segment_phones(db, user_oid: ObjectId, rule: SegmentRule) -> AsyncIterator[str]:
+    """Phones of the segment's contacts, streamed from the cursor"""
+    query = await validate_segment(db, user_oid, rule)
+    async for doc in db["contacts"].find(query, {"phone": 1, "_id": 0}).batch_size(1000):
+        if doc.get("phone"):
+            yield doc["phone"]
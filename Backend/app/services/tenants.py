@@ -0,0 +1,100 @@
+"""
+Tenant directory for webhook routing
+Resolves a WhatsApp phone_number_id to the user that owns it without a Mongo lookup per event
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional
+
+from pymongo.errors import PyMongoError
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Fallback refresh period when change streams are unavailable (standalone mongod)
+REFRESH_INTERVAL_SECONDS = 60
+
+
+class TenantDirectory:
+    """In-memory index of whatsapp_credentials keyed by phone_number_id"""
+
+    def __init__(self):
+        self._owners: Dict[str, str] = {}
+        self._numbers: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def load(self, db):
+        """Rebuild the index from the whatsapp_credentials collection"""
+        owners: Dict[str, str] = {}
+        numbers: Dict[str, str] = {}
+        projection = {"user_id": 1, "phone_number_id": 1}
+        async for cred in db["whatsapp_credentials"].find({}, projection):
+            user_id = cred.get("user_id")
+            phone_number_id = cred.get("phone_number_id")
+            if user_id and phone_number_id:
+                owners[phone_number_id] = user_id
+                numbers[user_id] = phone_number_id
+        # Swap both maps at once so readers never see a half-built index
+        self._owners, self._numbers = owners, numbers
+        logger.info(f"Tenant directory loaded with {len(owners)} phone numbers")
+
+    def resolve(self, phone_number_id: Optional[str]) -> Optional[str]:
+        """Return the owning user id for a phone_number_id, if known"""
+        if not phone_number_id:
+            return None
+        owner = self._owners.get(phone_number_id)
+        if owner is None and phone_number_id == settings.WHATSAPP_PHONE_NUMBER_ID:
+            return settings.WHATSAPP_DEFAULT_OWNER_ID
+        return owner
+
+    def set(self, user_id: str, phone_number_id: str):
+        previous = self._numbers.get(user_id)
+        if previous and previous != phone_number_id:
+            self._owners.pop(previous, None)
+        self._owners[phone_number_id] = user_id
+        self._numbers[user_id] = phone_number_id
+
+    def remove_user(self, user_id: str):
+        phone_number_id = self._numbers.pop(user_id, None)
+        if phone_number_id:
+            self._owners.pop(phone_number_id, None)
+
+    async def start(self, db):
+        await self.load(db)
+        self._task = asyncio.create_task(self._watch(db))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self, db):
+        """Follow credential changes made by any worker; poll if change streams aren't supported"""
+        try:
+            async with db["whatsapp_credentials"].watch(full_document="updateLookup") as stream:
+                async for change in stream:
+                    doc = change.get("fullDocument")
+                    if doc and doc.get("user_id") and doc.get("phone_number_id"):
+                        self.set(doc["user_id"], doc["phone_number_id"])
+                    else:
+                        # Deletes only carry the _id, so rebuild from scratch
+                        await self.load(db)
+        except PyMongoError as exc:
+            logger.info(f"Change streams unavailable ({exc}), polling credentials every {REFRESH_INTERVAL_SECONDS}s")
+
+        while True:
+            await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
+            try:
+                await self.load(db)
+            except PyMongoError as exc:
+                logger.warning(f"Tenant directory refresh failed: {exc}")
+
+
+# Singleton instance
+tenant_directory = TenantDirectory()
@@ -1,42 +1,204 @@
+import asyncio
+from http.cookies import SimpleCookie
+from typing import Dict, List, Optional, Set
+
 import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from socketio.exceptions import ConnectionRefusedError
+
+from app.core.security import TOKEN_COOKIE_NAME, decode_access_token
+from config import settings
+
+
+class InMemoryPubSubManager(AsyncPubSubManager):
+    """Process-local stand-in for a Redis/AMQP queue; lets several servers in one process share emits (tests)"""
+
+    name = "memory"
+    _subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    async def _publish(self, data):
+        for queue in self._subscribers.get(self.channel, []):
+            queue.put_nowait(data)
+
+    async def _listen(self):
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(self.channel, []).append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[self.channel].remove(queue)
+
+
+def build_client_manager(url: Optional[str], write_only: bool = False):
+    """Pick the Socket.IO client manager from a queue URL; None keeps the in-process default"""
+    if not url:
+        return None
+    channel = settings.SOCKETIO_CHANNEL
+    if url.startswith(("redis://", "rediss://")):
+        return socketio.AsyncRedisManager(url, channel=channel, write_only=write_only)
+    if url.startswith(("amqp://", "amqps://")):
+        return socketio.AsyncAioPikaManager(url, channel=channel, write_only=write_only)
+    if url.startswith("memory://"):
+        return InMemoryPubSubManager(channel=channel, write_only=write_only)
+    raise ValueError(f"Unsupported SOCKETIO_MESSAGE_QUEUE: {url}")
+
 
 sio = socketio.AsyncServer(
     async_mode="asgi",
     cors_allowed_origins="*",
+    client_manager=build_client_manager(settings.SOCKETIO_MESSAGE_QUEUE),
     logger=True,
     engineio_logger=True,
 )
 
-# User socket mapping: userId -> socketId
-user_sockets = {}
+
+class SocketRegistry:
+    """Bidirectional userId <-> socket id mapping for sockets held by this worker; a user may hold several sessions (tabs)"""
+
+    def __init__(self):
+        self._sids_by_user: Dict[str, Set[str]] = {}
+        self._user_by_sid: Dict[str, str] = {}
+
+    def register(self, user_id: str, sid: str) -> Optional[str]:
+        """Attach sid to user_id; returns the user the sid was previously bound to, if different"""
+        previous = self._user_by_sid.get(sid)
+        if previous == user_id:
+            return None
+        if previous is not None:
+            self.unregister(sid)
+        self._user_by_sid[sid] = user_id
+        self._sids_by_user.setdefault(user_id, set()).add(sid)
+        return previous
+
+    def unregister(self, sid: str) -> Optional[str]:
+        user_id = self._user_by_sid.pop(sid, None)
+        if user_id is None:
+            return None
+        sids = self._sids_by_user.get(user_id)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._sids_by_user[user_id]
+        return user_id
+
+    def user_for(self, sid: str) -> Optional[str]:
+        return self._user_by_sid.get(sid)
+
+    def sids_for(self, user_id: str) -> Set[str]:
+        return self._sids_by_user.get(user_id, set())
+
+    def is_connected(self, user_id: str) -> bool:
+        return user_id in self._sids_by_user
+
+    def __len__(self) -> int:
+        return len(self._user_by_sid)
+
+
+socket_registry = SocketRegistry()
 
 
 def create_socket_app(app):
     return socketio.ASGIApp(sio, app)
 
 
-def register_user_socket(user_id: str, sid: str):
-    user_sockets[user_id] = sid
+def user_room(user_id: str) -> str:
+    return f"user:{user_id}"
 
 
-def remove_user_by_sid(sid: str):
-    user_id_to_remove = None
-    for user_id, socket_id in user_sockets.items():
-        if socket_id == sid:
-            user_id_to_remove = user_id
-            break
-    if user_id_to_remove:
-        del user_sockets[user_id_to_remove]
-    return user_id_to_remove
+def register_user_socket(user_id: str, sid: str) -> Optional[str]:
+    return socket_registry.register(user_id, sid)
 
 
-def get_socket_for_user(user_id: str):
-    return user_sockets.get(user_id)
+def remove_user_by_sid(sid: str) -> Optional[str]:
+    return socket_registry.unregister(sid)
+
+
+def is_user_connected(user_id: str) -> bool:
+    return socket_registry.is_connected(user_id)
+
+
+async def emit_to_user(event: str, data, user_id: str):
+    """Deliver an event to every session of a user through their room, on whichever worker holds it"""
+    await sio.emit(event, data, to=user_room(user_id))
+
+
+def _token_from_handshake(environ, auth) -> Optional[str]:
+    if isinstance(auth, dict) and auth.get("token"):
+        return auth["token"]
+    cookie = SimpleCookie(environ.get("HTTP_COOKIE", ""))
+    morsel = cookie.get(TOKEN_COOKIE_NAME)
+    return morsel.value if morsel else None
+
+
+# Later statuses win when events for the same message are merged
+STATUS_RANK = {"sending": 0, "sent": 1, "delivered": 2, "read": 3, "failed": 4}
+STATUS_FLUSH_INTERVAL_SECONDS = 0.25
+
+
+class StatusEventBuffer:
+    """Per-room outbound buffer that coalesces message status events and flushes them as one batch"""
+
+    def __init__(self, interval: float = STATUS_FLUSH_INTERVAL_SECONDS):
+        self._interval = interval
+        self._pending: Dict[str, Dict[str, dict]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, user_id: str, event: dict):
+        room_events = self._pending.setdefault(user_room(user_id), {})
+        key = event["messageId"]
+        current = room_events.get(key)
+        if current is None or STATUS_RANK.get(event["status"], 0) >= STATUS_RANK.get(current["status"], 0):
+            room_events[key] = event
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        for room, events in pending.items():
+            # One room failing (e.g. a message queue hiccup) must not cost the others their batch
+            try:
+                await sio.emit("message_status_batch", {"updates": list(events.values())}, to=room)
+            except Exception as exc:
+                print(f"⚠️ Dropped {len(events)} status updates for {room}: {exc}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self._interval)
+            if self._pending:
+                try:
+                    await self.flush()
+                except Exception as exc:
+                    # Keep flushing later batches
+                    print(f"⚠️ Status flush failed: {exc}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+status_buffer = StatusEventBuffer()
 
 
 @sio.event
-async def connect(sid, environ):
-    print(f"🔌 Client connected: {sid}")
+async def connect(sid, environ, auth=None):
+    raw_token = _token_from_handshake(environ, auth)
+    user_id = decode_access_token(raw_token) if raw_token else None
+    if not user_id:
+        print(f"⛔ Rejected unauthenticated socket {sid}")
+        raise ConnectionRefusedError("unauthorized")
+
+    # Room membership comes only from the verified token, never from client-supplied ids
+    await sio.save_session(sid, {"user_id": user_id})
+    register_user_socket(user_id, sid)
+    await sio.enter_room(sid, user_room(user_id))
+    print(f"🔌 Client connected: {sid} (user {user_id})")
 
 
 @sio.event
@@ -44,15 +206,15 @@ async def disconnect(sid):
     print(f"🔌 Client disconnected: {sid}")
     user_id = remove_user_by_sid(sid)
     if user_id:
-        print(f"👤 Removed user {user_id} from socket mapping")
+        print(f"👤 Removed socket {sid} of user {user_id} from socket mapping")
 
 
 @sio.event
 async def register(sid, data):
-    user_id = data.get("userId") if data else None
-    if user_id:
-        register_user_socket(user_id, sid)
-        print(f"✅ Registered user {user_id} with socket {sid}")
-        await sio.emit("registered", {"userId": user_id}, to=sid)
-    else:
-        print("⚠️ Registration failed: no userId provided")
+    """Kept for older clients: confirms the authenticated user, ignoring any other userId sent"""
+    session = await sio.get_session(sid)
+    user_id = session.get("user_id")
+    requested = data.get("userId") if data else None
+    if requested and requested != user_id:
+        print(f"⚠️ Socket {sid} asked to register as {requested} but is authenticated as {user_id}")
+    await sio.emit("registered", {"userId": user_id}, to=sid)
@@ -0,0 +1,64 @@
+"""
+Per-request auth overhead with the principal cache on and off
+Run from Backend/: python -m benchmarks.bench_auth
+Uses one user in BENCH_DB (default swalay_bench) and calls get_current_user directly.
+"""
+
+import asyncio
+import os
+import statistics
+import time
+
+from fastapi.security import HTTPAuthorizationCredentials
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.requests import Request
+
+from app.core.dates import utcnow
+from app.core.security import create_access_token, get_current_user
+from app.services.principals import principal_cache
+from config import settings
+
+REQUESTS = 5_000
+BENCH_EMAIL = "bench-auth@swalay.local"
+
+
+async def _run(label: str, request: Request, creds: HTTPAuthorizationCredentials, db, clear_each: bool):
+    principal_cache.clear()
+    latencies = []
+    for _ in range(REQUESTS):
+        if clear_each:
+            principal_cache.clear()
+        t0 = time.perf_counter()
+        await get_current_user(request, creds, db)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{label:<12} p50 {statistics.median(latencies):8.1f} us  p99 {p99:8.1f} us")
+
+
+async def main():
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[os.environ.get("BENCH_DB", "swalay_bench")]
+    try:
+        await db["users"].update_one(
+            {"email": BENCH_EMAIL},
+            {"$setOnInsert": {"email": BENCH_EMAIL, "hashed_password": "-", "created_at": utcnow()}},
+            upsert=True,
+        )
+        user = await db["users"].find_one({"email": BENCH_EMAIL})
+        token = create_access_token(str(user["_id"]), BENCH_EMAIL)
+        creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+        request = Request({"type": "http", "headers": []})
+
+        if not principal_cache.enabled:
+            print("AUTH_CACHE_TTL_SECONDS is 0; the 'cache on' run measures the miss path")
+        print(f"{REQUESTS} sequential get_current_user calls")
+        await _run("cache off", request, creds, db, clear_each=True)
+        await _run("cache on", request, creds, db, clear_each=False)
+        print(principal_cache.stats())
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""
+JSON layer benchmark
+Run from Backend/: python -m benchmarks.bench_json
+Compares the old FastAPI path (response_model validation + jsonable_encoder + json) with
+AppJSONResponse on list payloads, and json vs orjson for webhook bodies.
+"""
+
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.core.dates import serialize_message
+from app.core.responses import AppJSONResponse, loads
+from models import ContactPublic
+
+CONTACTS = 5_000
+MESSAGES = 200
+ROUNDS = 50
+
+
+def _timed(label: str, rounds: int, fn):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed / rounds * 1000:9.3f} ms/op")
+
+
+def _contacts() -> List[dict]:
+    now = datetime.utcnow()
+    return [{
+        "id": str(ObjectId()),
+        "name": f"Customer {i}",
+        "phone": f"+91{9000000000 + i}",
+        "list_ids": [str(ObjectId()) for _ in range(i % 3)],
+        "created_at": (now - timedelta(minutes=i)).isoformat(),
+    } for i in range(CONTACTS)]
+
+
+def _messages() -> List[dict]:
+    now = datetime.utcnow()
+    return [serialize_message({
+        "_id": ObjectId(),
+        "chatId": "919000000000",
+        "owner": "tenant",
+        "direction": "incoming" if i % 2 else "outgoing",
+        "text": "Your order has shipped and will arrive tomorrow " * 2,
+        "status": "delivered",
+        "createdAt": now - timedelta(seconds=i),
+        "updatedAt": now - timedelta(seconds=i),
+    }) for i in range(MESSAGES)]
+
+
+def _webhook_body() -> bytes:
+    messages = [{
+        "from": f"91{9000000000 + i}",
+        "id": f"wamid.{i:032d}",
+        "timestamp": str(1700000000 + i),
+        "type": "text",
+        "text": {"body": "Hi, where is my order?"},
+    } for i in range(20)]
+    payload = {"object": "whatsapp_business_account", "entry": [{"id": "waba", "changes": [{
+        "field": "messages",
+        "value": {"metadata": {"phone_number_id": "123"}, "messages": messages},
+    }]}]}
+    return json.dumps(payload).encode()
+
+
+def main():
+    contacts = _contacts()
+    models = [ContactPublic(**c) for c in contacts]
+    adapter = TypeAdapter(List[ContactPublic])
+
+    def old_contacts():
+        validated = adapter.validate_python(models, from_attributes=True)
+        JSONResponse(jsonable_encoder(validated))
+
+    print(f"list_contacts, {CONTACTS} items")
+    _timed("validate + jsonable_encoder + json", ROUNDS, old_contacts)
+    _timed("AppJSONResponse (trusted dicts)", ROUNDS, lambda: AppJSONResponse(contacts))
+
+    messages = _messages()
+    print(f"get_messages, {MESSAGES} items")
+    _timed("jsonable_encoder + json", ROUNDS * 10, lambda: JSONResponse(jsonable_encoder(messages)))
+    _timed("AppJSONResponse", ROUNDS * 10, lambda: AppJSONResponse(messages))
+
+    body = _webhook_body()
+    print(f"webhook body, {len(body)} bytes")
+    _timed("json.loads", ROUNDS * 100, lambda: json.loads(body))
+    _timed("orjson.loads", ROUNDS * 100, lambda: loads(body))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Event-loop lag under a login burst
+Run from Backend/: python -m benchmarks.bench_password_hashing
+100 concurrent password verifications, run inline (the old behaviour) and through the hashing
+pool, while a probe task measures how late a 10 ms sleep wakes up.
+"""
+
+import asyncio
+import statistics
+import time
+
+from app.core.hashing import hashing_pool
+from app.core.security import pwd_context, verify_password
+
+LOGINS = 100
+PROBE_INTERVAL = 0.01
+PASSWORD = "correct horse battery staple"
+
+
+async def _probe(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append((time.perf_counter() - t0 - PROBE_INTERVAL) * 1000)
+
+
+async def _inline_verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+
+async def _measure(label: str, verify, hashed: str):
+    lags: list = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(_probe(lags, stop))
+    await asyncio.sleep(PROBE_INTERVAL * 3)
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(verify(PASSWORD, hashed) for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await probe
+    assert all(results)
+
+    lags.sort()
+    print(
+        f"{label:<10} burst {elapsed * 1000:8.1f} ms  "
+        f"loop lag p50 {statistics.median(lags):7.2f} ms  max {lags[-1]:8.2f} ms  ({len(lags)} probes)"
+    )
+
+
+async def main():
+    hashed = pwd_context.hash(PASSWORD)
+    print(f"{LOGINS} concurrent logins")
+    await _measure("inline", _inline_verify, hashed)
+    await _measure("pool", verify_password, hashed)
+    print(hashing_pool.stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
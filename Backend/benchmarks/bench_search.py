@@ -0,0 +1,83 @@
+"""
+Message search benchmark against a scratch database
+Run from Backend/: python -m benchmarks.bench_search [message_count]
+Seeds BENCH_DB (default swalay_bench) once, then reports p50/p99 for the /search/messages query.
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.api.routes.search import message_search_pipeline
+from app.db.indexes import reconcile_indexes
+from config import settings
+
+MESSAGE_COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+TENANTS = 50
+CHATS_PER_TENANT = 2_000
+QUERIES = 500
+PAGE_SIZE = 20
+WORDS = (
+    "order invoice payment refund delivery shipped tracking cancel return address "
+    "hello thanks please help urgent discount coupon account password otp confirm"
+).split()
+
+
+async def seed(db):
+    if await db["messages"].estimated_document_count() >= MESSAGE_COUNT:
+        return
+    await db["messages"].drop()
+    start = datetime.utcnow() - timedelta(days=365)
+    batch = []
+    for i in range(MESSAGE_COUNT):
+        batch.append({
+            "owner": f"tenant-{i % TENANTS}",
+            "chatId": f"91{random.randrange(CHATS_PER_TENANT):010d}",
+            "direction": "incoming",
+            "text": " ".join(random.choices(WORDS, k=8)) + f" #{i}",
+            "status": "delivered",
+            "createdAt": start + timedelta(seconds=i * 6),
+        })
+        if len(batch) == 10_000:
+            await db["messages"].insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db["messages"].insert_many(batch, ordered=False)
+
+
+async def main():
+    client = AsyncIOMotorClient(settings.MONGODB_URI)
+    db = client[os.environ.get("BENCH_DB", "swalay_bench")]
+    try:
+        await seed(db)
+        await reconcile_indexes(db)
+
+        latencies = []
+        for _ in range(QUERIES):
+            pipeline = message_search_pipeline(
+                f"tenant-{random.randrange(TENANTS)}",
+                " ".join(f'"{w}"' for w in random.sample(WORDS, 2)),
+                None,
+                None,
+                PAGE_SIZE,
+            )
+            t0 = time.perf_counter()
+            await db["messages"].aggregate(pipeline).to_list(length=PAGE_SIZE)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"{MESSAGE_COUNT} messages, {QUERIES} queries")
+        print(f"p50 {statistics.median(latencies):.1f} ms  p99 {p99:.1f} ms  max {latencies[-1]:.1f} ms")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
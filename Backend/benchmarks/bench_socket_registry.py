@@ -0,0 +1,47 @@
+"""
+Socket registry benchmark
+Run from Backend/: python -m benchmarks.bench_socket_registry
+"""
+
+import time
+
+from app.sockets import SocketRegistry
+
+CONNECTIONS = 50_000
+SESSIONS_PER_USER = 2
+
+
+def _timed(label: str, count: int, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed * 1000:9.2f} ms total  {elapsed / count * 1e6:7.3f} us/op")
+
+
+def main():
+    registry = SocketRegistry()
+    users = CONNECTIONS // SESSIONS_PER_USER
+    pairs = [(f"user-{i % users}", f"sid-{i}") for i in range(CONNECTIONS)]
+
+    def register_all():
+        for user_id, sid in pairs:
+            registry.register(user_id, sid)
+
+    def lookup_all():
+        for user_id, _ in pairs:
+            registry.is_connected(user_id)
+
+    def unregister_all():
+        for _, sid in pairs:
+            registry.unregister(sid)
+
+    print(f"{CONNECTIONS} sockets across {users} users")
+    _timed("register", CONNECTIONS, register_all)
+    assert len(registry) == CONNECTIONS
+    _timed("is_connected", CONNECTIONS, lookup_all)
+    _timed("unregister (disconnect)", CONNECTIONS, unregister_all)
+    assert len(registry) == 0
+
+
+if __name__ == "__main__":
+    main()
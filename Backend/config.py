@@ -13,9 +13,50 @@ class Settings(BaseSettings):
     META_BUSINESS_ID: str
     MONGODB_URI: str
     MONGODB_DB_NAME: str = "swalay"
+    # Message tiering: messages older than this many days (per-user override: users.message_retention_days)
+    # move to the compressed messages_archive collection
+    MESSAGE_HOT_RETENTION_DAYS: int = 90
+    RETENTION_INTERVAL_SECONDS: int = 3600
+    RETENTION_BATCH_SIZE: int = 5000
+    # In-memory window of the latest messages per recently viewed chat (first page of GET /messages)
+    MESSAGE_CACHE_WINDOW: int = 50
+    MESSAGE_CACHE_MAX_CHATS: int = 5000
+    MESSAGE_CACHE_TTL_SECONDS: int = 300
+    # Raw webhook payloads kept in webhook_events for debugging/replay, expired by a TTL index
+    WEBHOOK_JOURNAL_TTL_DAYS: int = 7
+    # Shared throttle for every message posted to the Graph API
+    WHATSAPP_SEND_RATE_PER_SECOND: float = 20.0
+    WHATSAPP_SEND_BURST: int = 20
+    # /send-template/bulk
+    BULK_SEND_MAX_ITEMS: int = 5000
+    BULK_SEND_CONCURRENCY: int = 8
+    # Outbox dispatcher for /send-message and /send-template
+    OUTBOX_CONCURRENCY: int = 4
+    OUTBOX_POLL_INTERVAL_SECONDS: float = 1.0
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    # How long Idempotency-Key reservations and their stored responses are kept
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    # Per-tenant dashboard counters; writes invalidate them, the TTL bounds staleness across workers
+    DASHBOARD_STATS_TTL_SECONDS: int = 30
+    DASHBOARD_STATS_MAX_TENANTS: int = 10000
+    # How often contact_lists.contact_count is recomputed from contacts to repair drift
+    LIST_COUNT_RECONCILE_INTERVAL_SECONDS: int = 6 * 3600
+    # Phone -> contact lookups for the webhook and inbox; a TTL of 0 disables the cache
+    CONTACT_DIRECTORY_TTL_SECONDS: int = 300
+    CONTACT_DIRECTORY_MAX_TENANTS: int = 1000
+    CONTACT_DIRECTORY_MAX_PHONES: int = 5000
+    # Log explain() plans of each route's canonical query at startup, flagging COLLSCANs
+    INDEX_DIAGNOSTICS: bool = False
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRES_IN_MINUTES: int = 600
+    # pbkdf2_sha256 work factor; stored hashes below it are upgraded on the next successful login
+    PASSWORD_HASH_ROUNDS: int = 29000
+    # Threads dedicated to password hashing (the cap on concurrent hashes)
+    PASSWORD_HASH_WORKERS: int = 2
+    # Verified principals cached per token by get_current_user; a TTL of 0 disables the cache
+    AUTH_CACHE_TTL_SECONDS: int = 60
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
     # Cookie settings - for GitHub Codespaces (HTTPS), set COOKIE_SECURE=true and COOKIE_SAMESITE=none
     COOKIE_SECURE: bool = True
     COOKIE_SAMESITE: str = "none"
@@ -24,6 +65,12 @@ class Settings(BaseSettings):
     FACEBOOK_APP_SECRET: Optional[str] = None
     FACEBOOK_REDIRECT_URI: Optional[str] = None
     META_API_VERSION: str = "v21.0"
+    # User that owns the env-configured WHATSAPP_PHONE_NUMBER_ID (numbers linked via onboarding resolve on their own)
+    WHATSAPP_DEFAULT_OWNER_ID: Optional[str] = None
+    # Socket.IO message queue for cross-worker fan-out (redis://..., amqp://... or memory:// for tests).
+    # Leave unset for a single-process deployment.
+    SOCKETIO_MESSAGE_QUEUE: Optional[str] = None
+    SOCKETIO_CHANNEL: str = "swalay-socketio"
     # Gemini AI API Key for Chatbot
     GEMINI_API_KEY: Optional[str] = None
 
@@ -1,11 +1,20 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 
 from app.api.routes import auth, broadcasts, media, messages, templates, webhook, onboarding, profile
-from app.api.routes import contacts, contact_lists, chatbot
+from app.api.routes import contacts, contact_lists, chatbot, conversations, search, segments
+from app.core.metrics import collect
+from app.core.responses import AppJSONResponse
+from app.db.indexes import bootstrap_indexes, ensure_unique_indexes
+from app.db.migrations import run_migrations
 from app.db.mongo import close_mongo, connect_to_mongo
-from app.sockets import create_socket_app
+from app.services.list_counts import list_count_loop
+from app.services.outbox import outbox_dispatcher
+from app.services.retention import retention_loop
+from app.services.tenants import tenant_directory
+from app.sockets import create_socket_app, status_buffer
 from config import settings
 
 import logging
@@ -19,15 +28,32 @@ logging.basicConfig(
 )
 logger = logging.getLogger("api")
 
+async def _bootstrap_db(db):
+    await bootstrap_indexes(db)
+    await run_migrations(db)
+    await asyncio.gather(retention_loop(db), list_count_loop(db))
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await connect_to_mongo(app)
+    await tenant_directory.start(app.state.db)
+    # Unique indexes must exist before any upsert can race in a duplicate; a failure stops startup
+    await ensure_unique_indexes(app.state.db)
+    outbox_dispatcher.start(app.state.db)
+    # The remaining index builds, migrations and the retention loop run in the background
+    # so startup isn't blocked
+    bootstrap = asyncio.create_task(_bootstrap_db(app.state.db))
     yield
     # Shutdown
+    bootstrap.cancel()
+    await outbox_dispatcher.stop()
+    await status_buffer.stop()
+    await tenant_directory.stop()
     await close_mongo(app)
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=AppJSONResponse)
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -64,12 +90,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Before-Cursor", "X-After-Cursor", "X-Next-Cursor"],
 )
 
 
 app.include_router(auth.router)
 app.include_router(webhook.router)
 app.include_router(messages.router)
+app.include_router(conversations.router)
 app.include_router(templates.router)
 app.include_router(media.router)
 app.include_router(broadcasts.router)
@@ -78,6 +106,8 @@ app.include_router(contact_lists.router)
 app.include_router(onboarding.router)
 app.include_router(profile.router)
 app.include_router(chatbot.router)
+app.include_router(search.router)
+app.include_router(segments.router)
 
 
 @app.get("/health")
@@ -85,4 +115,9 @@ async def health_check():
     return {"status": "ok", "service": "whatsapp-backend"}
 
 
+@app.get("/metrics")
+async def metrics():
+    return collect()
+
+
 socket_app = create_socket_app(app)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from typing import List, Optional, Literal, Any
+from typing import Dict, List, Optional, Literal, Any, Union
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
 
@@ -92,9 +92,15 @@ class TemplateRequest(BaseModel):
     location_name: Optional[str] = None
     location_address: Optional[str] = None
 
+class BulkTemplateRequest(BaseModel):
+    # Each item is sent independently and may use a different template
+    items: List[TemplateRequest]
+
 class BroadcastRequest(BaseModel):
     name: str
-    phones: List[str]
+    phones: List[str] = []
+    # Saved segment whose contacts are added to the audience (merged with phones)
+    segment_id: Optional[str] = None
     template_name: str
     template_id: Optional[str] = None
     language_code: str = "en"
@@ -120,12 +126,15 @@ class ContactCreate(BaseModel):
     name: str
     phone: str
     list_ids: Optional[List[str]] = []
+    attributes: Dict[str, Any] = {}
 
 
 class ContactUpdate(BaseModel):
     name: Optional[str] = None
     phone: Optional[str] = None
     list_ids: Optional[List[str]] = None
+    # Replaces the whole attribute map
+    attributes: Optional[Dict[str, Any]] = None
 
 
 class ContactPublic(BaseModel):
@@ -133,6 +142,7 @@ class ContactPublic(BaseModel):
     name: str
     phone: str
     list_ids: List[str] = []
+    attributes: Dict[str, Any] = {}
     created_at: str
 
 
@@ -144,6 +154,55 @@ class ContactListUpdate(BaseModel):
     name: Optional[str] = None
 
 
+class ContactFilter(BaseModel):
+    # All given criteria must match; an empty filter selects every contact
+    list_id: Optional[str] = None
+    phone_prefix: Optional[str] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+
+
+# Segments
+class SegmentCondition(BaseModel):
+    """
+    One targeting test on a contact:
+      list            in / not_in                 value: list ids
+      created_at      after / before              value: datetime
+                      within_days / not_within_days  value: days
+      last_inbound_at within_days / not_within_days  value: days (contacts never heard from are "not within")
+      attribute       eq / ne / in / exists / not_exists  key: attribute name
+    """
+    field: Literal["list", "created_at", "last_inbound_at", "attribute"]
+    op: Literal["in", "not_in", "after", "before", "within_days", "not_within_days", "eq", "ne", "exists", "not_exists"]
+    key: Optional[str] = None
+    value: Any = None
+
+
+class SegmentRule(BaseModel):
+    # "not" negates the "and" of its rules
+    op: Literal["and", "or", "not"]
+    rules: List[Union["SegmentRule", SegmentCondition]]
+
+
+SegmentRule.model_rebuild()
+
+
+class SegmentCreate(BaseModel):
+    name: str
+    rule: SegmentRule
+
+
+class SegmentUpdate(BaseModel):
+    name: Optional[str] = None
+    rule: Optional[SegmentRule] = None
+
+
+class ListMembershipRequest(BaseModel):
+    # Exactly one of contact_ids or filter
+    contact_ids: Optional[List[str]] = None
+    filter: Optional[ContactFilter] = None
+
+
 
 
 class WhatsAppCredential(BaseModel):
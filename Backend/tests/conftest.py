@@ -0,0 +1,18 @@
+import os
+import sys
+
+# Settings are read from the environment at import time; the tests never reach Meta or MongoDB
+for name in (
+    "WHATSAPP_ACCESS_TOKEN",
+    "WHATSAPP_PHONE_NUMBER_ID",
+    "WHATSAPP_WABA_ID",
+    "WHATSAPP_APP_ID",
+    "WHATSAPP_APP_SECRET",
+    "VERIFY_TOKEN",
+    "META_BUSINESS_ID",
+    "JWT_SECRET_KEY",
+):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.services.message_cache import MessageWindowCache  # noqa: E402
+
+START = datetime(2024, 1, 1)
+
+
+def _messages(count, chat_id="chat"):
+    """Newest first, as GET /messages queries them"""
+    return [
+        {"_id": i, "chatId": chat_id, "createdAt": START + timedelta(minutes=i), "text": str(i)}
+        for i in reversed(range(count))
+    ]
+
+
+def test_short_chat_is_served_from_cache():
+    cache = MessageWindowCache(window=50, max_chats=10, ttl_seconds=60)
+    cache.seed("owner", "chat", _messages(3))
+
+    page = cache.first_page("owner", "chat", 20)
+
+    assert [m["_id"] for m in page] == [2, 1, 0]
+    assert cache.hits == 1 and cache.misses == 0
+
+
+def test_short_chat_stays_complete_after_append():
+    cache = MessageWindowCache(window=50, max_chats=10, ttl_seconds=60)
+    cache.seed("owner", "chat", _messages(3))
+    cache.append("owner", {"_id": 3, "chatId": "chat", "createdAt": START + timedelta(minutes=3)})
+
+    assert [m["_id"] for m in cache.first_page("owner", "chat", 20)] == [3, 2, 1, 0]
+
+
+def test_full_window_short_of_limit_is_a_miss():
+    cache = MessageWindowCache(window=5, max_chats=10, ttl_seconds=60)
+    # A full window means older messages may exist beyond it
+    cache.seed("owner", "chat", _messages(5))
+    cache.append("owner", {"_id": 5, "chatId": "chat", "createdAt": START + timedelta(minutes=5)})
+
+    assert cache.first_page("owner", "chat", 5) is not None
+    assert cache.first_page("owner", "chat", 6) is None
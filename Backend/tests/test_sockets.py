@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+socketio = pytest.importorskip("socketio")
+pytest.importorskip("jose")
+
+from socketio.exceptions import ConnectionRefusedError  # noqa: E402
+
+from app import sockets  # noqa: E402
+
+
+def test_connect_without_token_is_refused():
+    with pytest.raises(ConnectionRefusedError):
+        asyncio.run(sockets.connect("sid-missing", {}, None))
+
+
+def test_connect_with_bad_token_is_refused():
+    with pytest.raises(ConnectionRefusedError):
+        asyncio.run(sockets.connect("sid-bad", {}, {"token": "not-a-jwt"}))
+
+    with pytest.raises(ConnectionRefusedError):
+        asyncio.run(sockets.connect("sid-cookie", {"HTTP_COOKIE": "access_token=garbage"}, None))
+
+
+def test_status_flush_survives_a_failing_room(monkeypatch):
+    delivered = []
+
+    async def emit(event, data, to=None):
+        if to == sockets.user_room("broken"):
+            raise RuntimeError("broker unavailable")
+        delivered.append((to, data))
+
+    monkeypatch.setattr(sockets.sio, "emit", emit)
+    buffer = sockets.StatusEventBuffer()
+
+    async def run():
+        buffer.add("broken", {"messageId": "m1", "status": "sent"})
+        buffer.add("ok", {"messageId": "m2", "status": "delivered"})
+        await buffer.flush()
+        await buffer.stop()
+
+    asyncio.run(run())
+
+    assert delivered == [(sockets.user_room("ok"), {"updates": [{"messageId": "m2", "status": "delivered"}]})]
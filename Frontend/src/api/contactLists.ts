@@ -1,3 +1,5 @@
+import { fetchAllPages } from './contacts';
+
 const BACKEND_URL = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:8000';
 
 export interface ContactList {
@@ -53,8 +55,24 @@ export const deleteContactList = async (id: string): Promise<{ success: boolean
     return response.json();
 };
 
-export const getContactsInList = async (id: string): Promise<Array<{ id: string; name: string; phone: string; created_at: string }>> => {
-    const response = await fetch(`${BACKEND_URL}/contacts/lists/${id}/contacts`, { credentials: 'include' });
-    if (!response.ok) throw new Error('Failed to fetch list contacts');
+export const updateListMembership = async (
+    id: string,
+    action: 'add' | 'remove',
+    contactIds: string[],
+): Promise<{ added?: number; removed?: number; contact_count: number }> => {
+    const response = await fetch(`${BACKEND_URL}/contacts/lists/${id}/contacts/${action}`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        credentials: 'include',
+        body: JSON.stringify({ contact_ids: contactIds }),
+    });
+    if (!response.ok) {
+        const err = await response.json();
+        throw new Error(err.detail || `Failed to ${action} contacts`);
+    }
     return response.json();
 };
+
+export const getContactsInList = async (id: string): Promise<Array<{ id: string; name: string; phone: string; created_at: string }>> => {
+    return fetchAllPages<{ id: string; name: string; phone: string; created_at: string }>(`${BACKEND_URL}/contacts/lists/${id}/contacts`, 'Failed to fetch list contacts');
+};
@@ -20,12 +20,26 @@ export interface ContactUpdateRequest {
     list_ids?: string[];
 }
 
+// Follows X-Next-Cursor until the last page
+export const fetchAllPages = async <T>(baseUrl: string, errorMessage: string): Promise<T[]> => {
+    const items: T[] = [];
+    let cursor: string | null = null;
+    do {
+        const url = new URL(baseUrl);
+        url.searchParams.set('limit', '500');
+        if (cursor) url.searchParams.set('before', cursor);
+        const response = await fetch(url.toString(), { credentials: 'include' });
+        if (!response.ok) throw new Error(errorMessage);
+        items.push(...(await response.json()));
+        cursor = response.headers.get('X-Next-Cursor');
+    } while (cursor);
+    return items;
+};
+
 export const getContacts = async (listId?: string): Promise<Contact[]> => {
     const url = new URL(`${BACKEND_URL}/contacts`);
     if (listId) url.searchParams.set('list_id', listId);
-    const response = await fetch(url.toString(), { credentials: 'include' });
-    if (!response.ok) throw new Error('Failed to fetch contacts');
-    return response.json();
+    return fetchAllPages<Contact>(url.toString(), 'Failed to fetch contacts');
 };
 
 export const getContactStats = async (): Promise<{ total: number }> => {
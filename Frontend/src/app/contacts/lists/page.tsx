@@ -7,8 +7,8 @@ import { Button } from "@/components/ui/Button";
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from "@/components/ui/DataTable";
 import { Input } from "@/components/ui/Input";
 import { Dialog, DialogContent, DialogFooter, DialogHeader, DialogTitle, DialogTrigger } from "@/components/ui/Dialog";
-import { getContactLists, updateContactList, deleteContactList, getContactsInList } from "@/api/contactLists";
-import { removeContactFromList, addContactToList, getContacts } from "@/api/contacts";
+import { getContactLists, updateContactList, deleteContactList, getContactsInList, updateListMembership } from "@/api/contactLists";
+import { getContacts } from "@/api/contacts";
 import { Plus, Trash2, Pencil, ArrowLeft } from "lucide-react";
 import Link from "next/link";
 
@@ -66,8 +66,8 @@ export default function ContactListsPage() {
         const toRemove = listContacts.filter((c) => !targetIds.has(c.id));
 
         await Promise.all([
-            ...toAdd.map((c) => addContactToList(c.id, activeListId)),
-            ...toRemove.map((c) => removeContactFromList(c.id, activeListId)),
+            toAdd.length ? updateListMembership(activeListId, 'add', toAdd.map((c) => c.id)) : null,
+            toRemove.length ? updateListMembership(activeListId, 'remove', toRemove.map((c) => c.id)) : null,
         ]);
 
         const updated = await getContactsInList(activeListId);
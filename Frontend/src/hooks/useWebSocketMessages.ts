@@ -39,13 +39,20 @@ export const useWebSocketMessages = ({
             }
         };
 
+        // React batches the state updates from one batch into a single render
+        const handleStatusBatch = (data: { updates: Array<{ messageId: string; whatsappMessageId?: string; status: string; timestamp?: string }> }) => {
+            data.updates.forEach(handleStatusUpdate);
+        };
+
         socketService.onNewMessage(handleNewMessage);
         socketService.onMessageStatusUpdate(handleStatusUpdate);
+        socketService.onMessageStatusBatch(handleStatusBatch);
 
         // Cleanup on unmount
         return () => {
             socketService.off('new_message', handleNewMessage);
             socketService.off('message_status_update', handleStatusUpdate);
+            socketService.off('message_status_batch', handleStatusBatch);
         };
     }, [userId, onNewMessage, onStatusUpdate]);
 
@@ -18,6 +18,8 @@ class SocketService {
         // Initialize socket connection
         this.socket = io(BACKEND_URL, {
             transports: ['websocket', 'polling'],
+            // Send the auth cookie; the server derives the user's room from it
+            withCredentials: true,
             reconnection: true,
             reconnectionDelay: 1000,
             reconnectionAttempts: 5,
@@ -102,6 +104,24 @@ class SocketService {
         this.socket.on(eventName, callback);
     }
 
+    // Listen for coalesced status updates (one event per flush window)
+    onMessageStatusBatch(callback: (data: { updates: any[] }) => void) {
+        if (!this.socket) {
+            console.warn('Socket not connected');
+            return;
+        }
+
+        const eventName = 'message_status_batch';
+
+        // Store listener for cleanup
+        if (!this.listeners.has(eventName)) {
+            this.listeners.set(eventName, new Set());
+        }
+        this.listeners.get(eventName)?.add(callback);
+
+        this.socket.on(eventName, callback);
+    }
+
     // Remove specific listener
     off(eventName: string, callback?: Function) {
         if (!this.socket) return;